@@ -4,35 +4,687 @@ Modern Flask Web Application for Enron Email Corpus Viewer
 Features: Responsive design with Tailwind CSS, mobile-first approach
 """
 
+import base64
+import hashlib
 import html
+import io
+import random
+import re
+import tempfile
+import threading
+import time
 import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta, date, timezone
-from typing import List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional, Union
 import os
 
 import polars as pl
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import (
+    Flask, Response, g, has_request_context, jsonify, render_template, request, redirect, stream_with_context,
+    url_for, send_from_directory
+)
 from markupsafe import Markup
 
+from util.build_search_index import (
+    ADDRESS_COLUMNS, ADDRESS_INDEX_FILE, CONTENT_VERSION_KEY, INDEXED_COLUMNS, REGEX_METACHARACTERS, address_postings,
+    corpus_fingerprint, dedupe_key, read_content_version, search_index
+)
+
 app = Flask(__name__)
 
 # Configuration
 PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
+INDEX_FILE = os.environ.get("ENRON_INDEX_FILE", "enron_index.pq")
+IPC_FILE = os.environ.get("ENRON_IPC_FILE", "enron.arrow")
+# Optional body store written by util/build_body_store.py: when present, the memory and lazy backends
+# read bodies from it by row id and the memory backend only loads the metadata columns
+BODY_FILE = os.environ.get("ENRON_BODY_FILE", "enron_bodies.pq")
+# Storage backend: "memory" (whole corpus loaded into RAM), "lazy" (scan the Parquet file per request,
+# reading only the columns and rows each operation needs) or "mmap" (memory-map the Arrow IPC file
+# written by util/convert_to_ipc.py, shared by every worker process through the page cache)
+BACKEND = os.environ.get("ENRON_BACKEND", "memory")
+# Rows per search shard for the memory and mmap backends (0 scans the corpus as a single shard). Shards are
+# contiguous runs of rows scanned in parallel; shards whose date range or folders can't match are skipped.
+SHARD_ROWS = int(os.environ.get("ENRON_SHARD_ROWS", "50000"))
+# Path lookup structure: "hash" (dict, fastest) or "sorted" (binary search over sorted paths, less memory)
+PATH_INDEX_MODE = os.environ.get("ENRON_PATH_INDEX", "hash")
+# Search result cache: number of searches kept per process (0 disables), seconds before an entry expires,
+# and an optional directory for a cache tier shared by all worker processes, holding at most
+# ENRON_SEARCH_CACHE_DIR_SIZE searches
+SEARCH_CACHE_SIZE = int(os.environ.get("ENRON_SEARCH_CACHE_SIZE", "256"))
+SEARCH_CACHE_TTL = float(os.environ.get("ENRON_SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_DIR = os.environ.get("ENRON_SEARCH_CACHE_DIR", "")
+SEARCH_CACHE_DIR_SIZE = int(os.environ.get("ENRON_SEARCH_CACHE_DIR_SIZE", "4096"))
+# Instrumentation: add a Server-Timing header with the per-stage timings of each response, and log
+# requests slower than this many milliseconds together with their query parameters (0 disables)
+SERVER_TIMING = os.environ.get("ENRON_SERVER_TIMING", "0") == "1"
+SLOW_QUERY_MS = float(os.environ.get("ENRON_SLOW_QUERY_MS", "1000"))
+# Upper bounds (seconds) of the latency histogram buckets exported at /metrics
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Metrics exported at /metrics: name -> (Prometheus type, description)
+METRIC_DESCRIPTIONS = {
+    "enron_request_duration_seconds": ("histogram", "Total request handling time by endpoint"),
+    "enron_stage_duration_seconds": ("histogram", "Time spent in each stage of request handling"),
+    "enron_requests_total": ("counter", "Requests by endpoint and status code"),
+    "enron_slow_requests_total": ("counter", "Requests slower than ENRON_SLOW_QUERY_MS by endpoint"),
+    "enron_search_cache_events_total": ("counter", "Search cache hits, misses and evictions"),
+    "enron_search_shards_total": ("counter", "Corpus shards scanned or skipped by searches"),
+}
+# Search results per page (a page_size query argument may ask for up to MAX_PAGE_SIZE) and the number of
+# body characters returned with each result
+PAGE_SIZE = int(os.environ.get("ENRON_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.environ.get("ENRON_MAX_PAGE_SIZE", "1000"))
+SNIPPET_LENGTH = int(os.environ.get("ENRON_SNIPPET_LENGTH", "300"))
+# Time zone dates are shown in (stored dates are UTC)
+DISPLAY_TIME_ZONE = os.environ.get("ENRON_TIME_ZONE", "US/Central")
+# Rows fetched at a time by /api/export, and the supported formats: (MIME type, file extension)
+EXPORT_BATCH_SIZE = int(os.environ.get("ENRON_EXPORT_BATCH_SIZE", "1000"))
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+# Columns of an email row, in the order returned by get_email and friends
+EMAIL_COLUMNS = ["path", "date", "subject", "sender", "recipient", "body"]
+# Search result rows carry only the start of the body
+SNIPPET_COLUMNS = EMAIL_COLUMNS[:-1] + [pl.col("body").str.slice(0, SNIPPET_LENGTH)]
+# Email page row, with the date formatted for display
+EMAIL_DETAIL_COLUMNS = [
+    "path",
+    pl.col("date").dt.convert_time_zone(DISPLAY_TIME_ZONE).dt.strftime("%Y-%m-%d %I:%M %p"),
+    *EMAIL_COLUMNS[2:],
+]
+# Search query language: field prefixes ("from:jeff") and the columns they search, the columns searched by
+# terms without one in the quick search box, and the limits on "~" regular expressions
+QUERY_FIELDS = {
+    "from": ("sender",),
+    "sender": ("sender",),
+    "to": ("recipient",),
+    "recipient": ("recipient",),
+    "participant": tuple(ADDRESS_COLUMNS),
+    "subject": ("subject",),
+    "body": ("body",),
+    "path": ("path",),
+}
+QUICK_SEARCH_FIELDS = ("subject", "sender", "recipient", "body")
+MAX_REGEX_LENGTH = int(os.environ.get("ENRON_MAX_REGEX_LENGTH", "100"))
+# Size limit: the length of the regex with its counted repeats written out ("\w{5}" counts 5), which bounds the size
+# of its automaton. Large automata over big character classes make a scan many times slower.
+MAX_REGEX_SIZE = int(os.environ.get("ENRON_MAX_REGEX_SIZE", "50"))
 _df_cache: Optional[pl.DataFrame] = None
+# (size, mtime) of the corpus file this process loaded, which keys the cached search results
+_corpus_version: Optional[Tuple[int, int]] = None
+# Hash of the contents recorded in the loaded corpus file, and the fingerprint the derived files must match
+_corpus_content_version = ""
+_corpus_fingerprint: Optional[str] = None
+_paths_cache: Optional[pl.Series] = None
+_date_sorted: Optional[bool] = None
+_row_group_offsets: Dict[str, List[int]] = {}
+_body_columns: Optional[List[str]] = None
+_path_index: Optional[Union[Dict[str, int], Tuple[pl.Series, pl.Series]]] = None
+_index_cache: Optional[pl.DataFrame] = None
+_shards: Optional[pl.DataFrame] = None
+# Random picks: (row ids of the dated emails ordered by (month, day) bucket, within each bucket the newest email
+# of every group of duplicates first; start offset of each bucket; count of those newest emails per bucket;
+# row ids of the newest email of every group of duplicates)
+_random_index: Optional[Tuple[pl.Series, List[int], List[int], pl.Series]] = None
+# (month, day) buckets of the random index: (month - 1) * 31 + (day - 1)
+DAY_BUCKETS = 12 * 31
+_index_loaded = False
+_address_index_cache: Optional[pl.DataFrame] = None
+_address_index_loaded = False
+_search_cache: "OrderedDict[Tuple, Tuple[float, pl.Series, int]]" = OrderedDict()
+_search_cache_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+# Guards the search cache and its stats (request handlers run on several threads)
+_search_cache_lock = threading.Lock()
+# Metrics since process start, keyed on (metric name, Prometheus label string).
+# Histogram values are the cumulative bucket counts, then the total count and the sum of the observations.
+_metrics_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str], List[float]] = {}
+_counters: Dict[Tuple[str, str], float] = {}
 
 
 def get_dataframe() -> pl.DataFrame:
     """Get or load the parquet dataframe (cached)"""
-    global _df_cache
+    global _df_cache, _corpus_version, _corpus_content_version
     if _df_cache is None:
-        _df_cache = pl.read_parquet(PARQUET_FILE)
+        if BACKEND == "mmap":
+            # Zero-copy: the columns point straight into the mapped file
+            source = pa.memory_map(IPC_FILE)
+            _corpus_version = file_version(source)
+            reader = pa.ipc.open_file(source)
+            _corpus_content_version = (reader.schema.metadata or {}).get(CONTENT_VERSION_KEY.encode(), b"").decode()
+            _df_cache = pl.from_arrow(reader.read_all(), rechunk=False)
+        else:
+            # Bodies in the body store are left on disk
+            body_columns = get_body_columns()
+            with open(PARQUET_FILE, "rb") as source:
+                _corpus_version = file_version(source)
+                _corpus_content_version = read_content_version(source)
+                source.seek(0)
+                columns = [c for c in pl.read_parquet_schema(source) if c not in body_columns]
+                source.seek(0)
+                _df_cache = pl.read_parquet(source, columns=columns)
     return _df_cache
 
 
+def get_corpus_fingerprint() -> str:
+    """Get the fingerprint of the row order and contents of the loaded corpus (cached)"""
+    global _corpus_fingerprint
+    if _corpus_fingerprint is None:
+        paths = get_paths()
+        _corpus_fingerprint = corpus_fingerprint(paths, _corpus_content_version)
+    return _corpus_fingerprint
+
+
+def scan_derived_file(file: str, builder: str, fingerprint: Optional[str] = None) -> Optional[pl.LazyFrame]:
+    """Scan a file derived from the corpus (search index, body store, address index), or None if it is missing
+    or was built from a different corpus (checked against its fingerprint of the corpus paths and contents)"""
+    if not os.path.exists(file):
+        return None
+    metadata = pl.read_parquet_metadata(file)
+    if metadata.get("corpus_fingerprint") != (get_corpus_fingerprint() if fingerprint is None else fingerprint):
+        app.logger.warning("Ignoring %s: built from a different %s, rebuild with %s", file, PARQUET_FILE, builder)
+        return None
+    return pl.scan_parquet(file)
+
+
+def get_body_columns() -> List[str]:
+    """Get the columns read from the body store, or [] when there is none or it is stale (cached)"""
+    global _body_columns
+    if _body_columns is None:
+        _body_columns = []
+        # A mapped corpus doesn't load the bodies into process memory in the first place
+        if BACKEND != "mmap" and os.path.exists(BODY_FILE):
+            # Not get_corpus_fingerprint(): loading the corpus in memory depends on the body columns
+            with open(PARQUET_FILE, "rb") as source:
+                content = read_content_version(source)
+                source.seek(0)
+                paths = pl.read_parquet(source, columns=["path"])["path"]
+            body_store = scan_derived_file(BODY_FILE, "util/build_body_store.py", corpus_fingerprint(paths, content))
+            if body_store is not None:
+                _body_columns = body_store.collect_schema().names()
+    return _body_columns
+
+
+def in_body_store(column: Union[str, pl.Expr]) -> bool:
+    """Check whether a column (or an expression on columns) is read from the body store"""
+    names = [column] if isinstance(column, str) else column.meta.root_names()
+    return any(name in get_body_columns() for name in names)
+
+
+def scan_emails(row_ids: Optional[pl.Series] = None) -> pl.LazyFrame:
+    """Lazy view of the corpus (optionally only the given rows) with a row_id column"""
+    if BACKEND == "lazy":
+        lf = pl.scan_parquet(PARQUET_FILE).with_row_index("row_id")
+        if row_ids is not None:
+            lf = lf.filter(pl.col("row_id").is_in(row_ids.implode()))
+        return lf
+
+    df = get_dataframe().with_row_index("row_id")
+    if row_ids is not None:
+        df = df[row_ids]
+    return df.lazy()
+
+
+def get_columns() -> List[str]:
+    """Get the column names of the corpus, including those in the body store"""
+    if BACKEND == "lazy":
+        return list(pl.read_parquet_schema(PARQUET_FILE))
+    return get_dataframe().columns + get_body_columns()
+
+
+def get_paths() -> pl.Series:
+    """Get the path column of the corpus (cached)"""
+    global _paths_cache, _corpus_version, _corpus_content_version
+    if _paths_cache is None:
+        if BACKEND == "lazy":
+            with open(PARQUET_FILE, "rb") as source:
+                _corpus_version = file_version(source)
+                _corpus_content_version = read_content_version(source)
+                source.seek(0)
+                _paths_cache = pl.read_parquet(source, columns=["path"])["path"]
+        else:
+            _paths_cache = get_dataframe()["path"]
+    return _paths_cache
+
+
+def is_date_sorted() -> bool:
+    """Check whether the corpus rows are stored in ascending date order (cached)"""
+    global _date_sorted
+    if _date_sorted is None:
+        if BACKEND == "lazy":
+            dates = pl.read_parquet(PARQUET_FILE, columns=["date"])["date"]
+        else:
+            dates = get_dataframe()["date"]
+        _date_sorted = dates.is_sorted()
+    return _date_sorted
+
+
+def fetch_row(row_index: int, columns: List[Union[str, pl.Expr]] = EMAIL_COLUMNS) -> Tuple:
+    """Fetch a single email row by row index"""
+    if get_body_columns():
+        return fetch_rows(pl.Series([row_index], dtype=pl.UInt32), columns).row(0)
+    if BACKEND == "lazy":
+        return pl.scan_parquet(PARQUET_FILE).slice(row_index, 1).select(columns).collect().row(0)
+    return get_dataframe().slice(row_index, 1).select(columns).row(0)
+
+
+def get_row_group_offsets(source: str = PARQUET_FILE) -> List[int]:
+    """Get the first row index of each row group of a Parquet file, plus the total row count (cached)"""
+    if source not in _row_group_offsets:
+        metadata = pq.ParquetFile(source).metadata
+        offsets = [0]
+        for i in range(metadata.num_row_groups):
+            offsets.append(offsets[-1] + metadata.row_group(i).num_rows)
+        _row_group_offsets[source] = offsets
+    return _row_group_offsets[source]
+
+
+def read_rows(source: str, row_ids: pl.Series, columns: List[Union[str, pl.Expr]]) -> pl.DataFrame:
+    """Read row_id plus the given columns for some rows of a Parquet file, in no particular order"""
+    # Only read the row groups that contain the requested rows (slice pushdown per row group)
+    offsets = get_row_group_offsets(source)
+    wanted = row_ids.cast(pl.UInt32).sort()
+    cuts = wanted.search_sorted(pl.Series(offsets, dtype=pl.UInt32)).to_list()
+    groups_read = sum(last > first for first, last in zip(cuts, cuts[1:]))
+    if groups_read > (len(offsets) - 1) // 2:
+        # Most of the file is needed anyway, a single scan is cheaper than one per row group
+        scan = pl.scan_parquet(source).with_row_index("row_id")
+        if len(wanted) < offsets[-1]:
+            scan = scan.filter(pl.col("row_id").is_in(wanted.implode()))
+        return scan.select("row_id", *columns).collect()
+
+    scans = []
+    for start, end, first, last in zip(offsets, offsets[1:], cuts, cuts[1:]):
+        if last > first:
+            scans.append(
+                pl.scan_parquet(source)
+                .slice(start, end - start)
+                .with_row_index("row_id", offset=start)
+                .filter(pl.col("row_id").is_in(wanted.slice(first, last - first).implode()))
+                .select("row_id", *columns)
+            )
+    if not scans:
+        scans.append(pl.scan_parquet(source).with_row_index("row_id").select("row_id", *columns).head(0))
+    return pl.concat(pl.collect_all(scans))
+
+
+def fetch_rows(row_ids: pl.Series, columns: List[Union[str, pl.Expr]] = EMAIL_COLUMNS) -> pl.DataFrame:
+    """Fetch email rows by row index, in the given order"""
+    body_store_columns = [c for c in columns if in_body_store(c)]
+    corpus_columns = [c for c in columns if not in_body_store(c)]
+    if BACKEND == "lazy":
+        fetched = read_rows(PARQUET_FILE, row_ids, corpus_columns)
+    else:
+        fetched = get_dataframe().with_row_index("row_id")[row_ids].select("row_id", *corpus_columns)
+    if body_store_columns:
+        fetched = fetched.join(read_rows(BODY_FILE, row_ids, body_store_columns), on="row_id", how="left")
+
+    order = pl.DataFrame({"row_id": row_ids.cast(pl.UInt32)})
+    names = [c if isinstance(c, str) else c.meta.output_name() for c in columns]
+    return order.join(fetched, on="row_id", how="left", maintain_order="left").select(names)
+
+
+def get_path_index() -> Union[Dict[str, int], Tuple[pl.Series, pl.Series]]:
+    """Get or build the path -> row index lookup structure (cached)"""
+    global _path_index
+    if _path_index is None:
+        paths = get_paths()
+        if PATH_INDEX_MODE == "sorted":
+            order = paths.arg_sort()
+            _path_index = (paths.gather(order), order)
+        else:
+            _path_index = {path: i for i, path in enumerate(paths)}
+    return _path_index
+
+
+def find_row(path: str) -> Optional[int]:
+    """Find the row index of an email by path"""
+    path_index = get_path_index()
+    if isinstance(path_index, dict):
+        return path_index.get(path)
+
+    sorted_paths, order = path_index
+    i = sorted_paths.search_sorted(path)
+    if i < len(sorted_paths) and sorted_paths[i] == path:
+        return order[i]
+    return None
+
+
+def get_search_index() -> Optional[pl.DataFrame]:
+    """Get or load the inverted search index (cached), or None if missing or stale"""
+    global _index_cache, _index_loaded
+    if not _index_loaded:
+        _index_loaded = True
+        index = scan_derived_file(INDEX_FILE, "util/build_search_index.py")
+        if index is not None:
+            _index_cache = index.collect()
+    return _index_cache
+
+
+def get_shards() -> pl.DataFrame:
+    """
+    Get the search shards (cached): the start and end row of each, with its date range and the distinct
+    lowercase folders (path up to the file name) of its emails, for pruning.
+    """
+    global _shards
+    if _shards is None:
+        df = get_dataframe()
+        shard_rows = SHARD_ROWS if SHARD_ROWS > 0 else max(len(df), 1)
+        path_lower = lowercase_col(df.columns, "path")
+        _shards = (
+            df.select(
+                (pl.int_range(pl.len(), dtype=pl.UInt32) // shard_rows).alias("shard"),
+                "date",
+                path_lower.str.replace(r"[^/]*$", "").alias("folder"),
+            )
+            .group_by("shard", maintain_order=True)
+            .agg(
+                pl.col("date").min().alias("min_date"),
+                pl.col("date").max().alias("max_date"),
+                pl.col("folder").unique(),
+            )
+            .select(
+                (pl.col("shard") * shard_rows).alias("start"),
+                pl.min_horizontal((pl.col("shard") + 1) * shard_rows, len(df)).alias("end"),
+                "min_date",
+                "max_date",
+                "folder",
+            )
+        )
+    return _shards
+
+
+def scan_shards(
+    candidates: Optional[pl.Series],
+    start_datetime: Optional[datetime],
+    end_datetime: Optional[datetime],
+    path_terms: List[str],
+    columns: List[str],
+) -> List[pl.LazyFrame]:
+    """
+    Lazy views of the shards that can hold matches, limited to the candidate rows, with a row_id column
+    and the given columns. path_terms are lowercase strings every matching path contains.
+    """
+    if BACKEND == "lazy":
+        # The Parquet row groups play the part of shards, pruned on their statistics by the scan itself
+        return [scan_emails(candidates)]
+
+    shards = get_shards()
+    keep = pl.lit(True)
+    if start_datetime is not None:
+        keep &= pl.col("max_date") >= start_datetime
+    if end_datetime is not None:
+        keep &= pl.col("min_date") < end_datetime
+    for path_term in path_terms:
+        if "/" in path_term:
+            # A match either lies within the folder part of the path, or the search's last "/" is the
+            # one between the folder and the file name
+            folder_part = path_term[: path_term.rindex("/") + 1]
+            keep &= pl.col("folder").list.eval(
+                pl.element().str.contains(path_term, literal=True) | pl.element().str.ends_with(folder_part)
+            ).list.any()
+    selected = shards.filter(keep.fill_null(False))
+    if candidates is not None:
+        candidates = candidates.cast(pl.UInt32).sort()
+        cuts = candidates.search_sorted(pl.concat([selected["start"], selected["end"]]))
+        selected = selected.with_columns(
+            first=cuts.head(len(selected)), last=cuts.tail(len(selected))
+        ).filter(pl.col("last") > pl.col("first"))
+    increment("enron_search_shards_total", 'state="scanned"', len(selected))
+    increment("enron_search_shards_total", 'state="skipped"', len(shards) - len(selected))
+
+    # Candidate rows are gathered from the needed columns only
+    df = get_dataframe().select([c for c in columns if c != "row_id"])
+    frames = []
+    for shard in selected.iter_rows(named=True):
+        shard_df = df.slice(shard["start"], shard["end"] - shard["start"]).with_row_index("row_id", offset=shard["start"])
+        if candidates is not None:
+            shard_df = shard_df[candidates.slice(shard["first"], shard["last"] - shard["first"]) - shard["start"]]
+        frames.append(shard_df.lazy())
+    if not frames:
+        frames.append(df.with_row_index("row_id").head(0).lazy())
+    return frames
+
+
+def get_address_index() -> Optional[pl.DataFrame]:
+    """Get or load the address index (cached), or None if missing or stale"""
+    global _address_index_cache, _address_index_loaded
+    if not _address_index_loaded:
+        _address_index_loaded = True
+        address_index = scan_derived_file(ADDRESS_INDEX_FILE, "util/build_search_index.py")
+        if address_index is not None:
+            _address_index_cache = address_index.collect()
+    return _address_index_cache
+
+
+def lowercase_col(columns: List[str], name: str) -> pl.Expr:
+    """Lowercase version of a column, using the precomputed "<name>_lc" shadow column when available"""
+    shadow = f"{name}_lc"
+    if shadow in columns:
+        return pl.col(shadow)
+    return pl.col(name).str.to_lowercase()
+
+
 def get_total_count() -> int:
     """Get total number of emails"""
-    df = get_dataframe()
-    return len(df)
+    return len(get_paths())
+
+
+def file_version(source) -> Tuple[int, int]:
+    """Get the (size, mtime) of an open corpus file, which stays that of the file that was opened even if
+    the path is replaced afterwards"""
+    stat = os.fstat(source.fileno())
+    return stat.st_size, stat.st_mtime_ns
+
+
+def get_corpus_version() -> Tuple[int, int]:
+    """Get the (size, mtime) of the corpus this process loaded, used to key cached search results"""
+    if _corpus_version is None:
+        get_paths()
+    return _corpus_version
+
+
+def search_cache_tag() -> str:
+    """Filename prefix of the on-disk cache entries for the corpus version this process loaded (<mtime>-<size>)"""
+    size, mtime = get_corpus_version()
+    return f"{mtime}-{size}"
+
+
+def search_cache_file(key: Tuple) -> str:
+    """Path of the on-disk cache entry for a search"""
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(SEARCH_CACHE_DIR, f"{search_cache_tag()}-{digest}.pq")
+
+
+def search_cache_get(key: Tuple) -> Optional[Tuple[pl.Series, int]]:
+    """Look up cached search results: (row ids, total count), or None on a miss"""
+    if SEARCH_CACHE_SIZE <= 0 and not SEARCH_CACHE_DIR:
+        return None
+
+    # The in-memory entries all hold row ids into the corpus this process loaded
+    with _search_cache_lock:
+        entry = _search_cache.get(key)
+        if entry is not None:
+            created, row_ids, total_count = entry
+            if time.monotonic() - created <= SEARCH_CACHE_TTL:
+                _search_cache.move_to_end(key)
+                _search_cache_stats["hits"] += 1
+                return row_ids, total_count
+            del _search_cache[key]
+
+    # Shared on-disk tier (visible to every worker process)
+    if SEARCH_CACHE_DIR:
+        cache_file = search_cache_file(key)
+        try:
+            if time.time() - os.path.getmtime(cache_file) <= SEARCH_CACHE_TTL:
+                row_ids = pl.read_parquet(cache_file)["row_id"]
+                total_count = int(pl.read_parquet_metadata(cache_file)["total_count"])
+                with _search_cache_lock:
+                    _search_cache_stats["disk_hits"] += 1
+                search_cache_put(key, row_ids, total_count, write_disk=False)
+                return row_ids, total_count
+            os.remove(cache_file)
+        except (OSError, KeyError, pl.exceptions.PolarsError):
+            pass
+
+    with _search_cache_lock:
+        _search_cache_stats["misses"] += 1
+    return None
+
+
+def search_cache_put(key: Tuple, row_ids: pl.Series, total_count: int, write_disk: bool = True) -> None:
+    """Store search results in the cache, evicting the least recently used entries"""
+    if SEARCH_CACHE_SIZE > 0:
+        with _search_cache_lock:
+            _search_cache[key] = (time.monotonic(), row_ids, total_count)
+            _search_cache.move_to_end(key)
+            while len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+                _search_cache_stats["evictions"] += 1
+
+    if SEARCH_CACHE_DIR and write_disk:
+        # A failed cache write only costs the next lookup a miss, never the search itself
+        temp_file = None
+        try:
+            os.makedirs(SEARCH_CACHE_DIR, exist_ok=True)
+            cache_file = search_cache_file(key)
+            # Unique per write: concurrent threads of one process may store the same search
+            fd, temp_file = tempfile.mkstemp(suffix=".tmp", dir=SEARCH_CACHE_DIR)
+            os.close(fd)
+            pl.DataFrame({"row_id": row_ids}).write_parquet(temp_file, metadata={"total_count": str(total_count)})
+            os.replace(temp_file, cache_file)
+            temp_file = None
+            prune_search_cache_dir()
+        except (OSError, pl.exceptions.PolarsError) as e:
+            app.logger.warning("Could not write the search cache entry to %s: %s", SEARCH_CACHE_DIR, e)
+        finally:
+            if temp_file is not None and os.path.exists(temp_file):
+                os.remove(temp_file)
+
+
+def prune_search_cache_dir() -> None:
+    """Remove on-disk cache entries from older corpus versions, expired ones, and the oldest beyond the size cap"""
+    tag = search_cache_tag()
+    corpus_mtime = get_corpus_version()[1]
+    now = time.time()
+    stale, current = [], []
+    for entry in os.scandir(SEARCH_CACHE_DIR):
+        if not entry.name.endswith(".pq"):
+            continue
+        try:
+            mtime = entry.stat().st_mtime
+        except OSError:
+            continue
+        entry_tag = entry.name.rsplit("-", 1)[0]
+        if now - mtime > SEARCH_CACHE_TTL:
+            stale.append(entry.path)
+        elif entry_tag == tag:
+            current.append((mtime, entry.path))
+        # Entries of a newer corpus belong to workers that already loaded it
+        elif not entry_tag.split("-")[0].isdigit() or int(entry_tag.split("-")[0]) < corpus_mtime:
+            stale.append(entry.path)
+    current.sort()
+    stale.extend(path for _, path in current[:max(len(current) - SEARCH_CACHE_DIR_SIZE, 0)])
+
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            # Already removed by another worker process
+            continue
+        with _search_cache_lock:
+            _search_cache_stats["disk_evictions"] += 1
+
+
+def observe(name: str, labels: str, seconds: float) -> None:
+    """Record a duration in a latency histogram"""
+    with _metrics_lock:
+        values = _histograms.setdefault((name, labels), [0] * (len(METRICS_BUCKETS) + 2))
+        for i, bound in enumerate(METRICS_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += 1
+        values[-1] += seconds
+
+
+def increment(name: str, labels: str, amount: float = 1) -> None:
+    """Increment a counter"""
+    with _metrics_lock:
+        _counters[(name, labels)] = _counters.get((name, labels), 0) + amount
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time a stage of request handling, for /metrics and the Server-Timing header"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("enron_stage_duration_seconds", f'stage="{stage}"', elapsed)
+        if has_request_context() and "stage_timings" in g:
+            g.stage_timings[stage] = g.stage_timings.get(stage, 0) + elapsed
+
+
+def format_metrics() -> str:
+    """Render all metrics in the Prometheus text exposition format"""
+    samples: Dict[str, List[str]] = {name: [] for name in METRIC_DESCRIPTIONS}
+    with _metrics_lock:
+        for (name, labels), values in sorted(_histograms.items()):
+            for bound, count in zip(METRICS_BUCKETS, values):
+                samples[name].append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            samples[name].append(f'{name}_bucket{{{labels},le="+Inf"}} {values[-2]}')
+            samples[name].append(f"{name}_count{{{labels}}} {values[-2]}")
+            samples[name].append(f"{name}_sum{{{labels}}} {values[-1]}")
+        for (name, labels), value in sorted(_counters.items()):
+            samples[name].append(f"{name}{{{labels}}} {value}")
+    with _search_cache_lock:
+        cache_events = dict(_search_cache_stats)
+    for event, value in cache_events.items():
+        samples["enron_search_cache_events_total"].append(f'enron_search_cache_events_total{{event="{event}"}} {value}')
+
+    lines = []
+    for name, (metric_type, description) in METRIC_DESCRIPTIONS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
+
+
+@app.before_request
+def start_request_timer() -> None:
+    """Start timing the request"""
+    g.request_start = time.perf_counter()
+    g.stage_timings = {}
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    """Record the request duration, add the Server-Timing header and log slow requests"""
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or "unknown"
+    observe("enron_request_duration_seconds", f'endpoint="{endpoint}"', elapsed)
+    increment("enron_requests_total", f'endpoint="{endpoint}",status="{response.status_code}"')
+
+    if SERVER_TIMING:
+        timings = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in g.stage_timings.items()]
+        timings.append(f"total;dur={elapsed * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(timings)
+
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS:
+        increment("enron_slow_requests_total", f'endpoint="{endpoint}"')
+        stages = ", ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in g.stage_timings.items())
+        app.logger.warning(
+            "Slow request (%.0f ms) %s %s [%s]", elapsed * 1000, request.path, request.args.to_dict(), stages
+        )
+    return response
 
 
 @app.template_filter('intcomma')
@@ -68,28 +720,46 @@ def index():
     return render_template("index.html", total_count=total_count)
 
 
+def get_search_criteria() -> Dict[str, str]:
+    """Get the search parameters of the request, as keyword arguments for search_emails and friends"""
+    return {
+        "query": request.args.get("q", "").strip(),
+        "sender": request.args.get("sender", "").strip(),
+        "recipient": request.args.get("recipient", "").strip(),
+        "participant": request.args.get("participant", "").strip(),
+        "subject": request.args.get("subject", "").strip(),
+        "body": request.args.get("body", "").strip(),
+        "path_search": request.args.get("path", "").strip(),
+        "start_date": request.args.get("start_date", "").strip(),
+        "end_date": request.args.get("end_date", "").strip(),
+    }
+
+
+def get_page_size() -> int:
+    """Get the requested number of results per page, clamped to 1..MAX_PAGE_SIZE"""
+    return min(max(request.args.get("page_size", PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+
 @app.route("/search")
 def search():
     """Search emails and display results"""
     # Get search parameters
-    search_query = request.args.get("q", "").strip()
-    sender = request.args.get("sender", "").strip()
-    recipient = request.args.get("recipient", "").strip()
-    participant = request.args.get("participant", "").strip()
-    subject = request.args.get("subject", "").strip()
-    body = request.args.get("body", "").strip()
-    path_search = request.args.get("path", "").strip()
-    start_date = request.args.get("start_date", "").strip()
-    end_date = request.args.get("end_date", "").strip()
+    criteria = get_search_criteria()
+    cursor = request.args.get("cursor", "").strip()
+    page_size = get_page_size()
 
     # Check if at least one search criterion is provided
-    if not any([search_query, sender, recipient, participant, subject, body, path_search, start_date, end_date]):
+    if not any(criteria.values()):
         return redirect(url_for("index"))
 
     # Perform search
-    results, total_count = search_emails(
-        search_query, sender, recipient, participant, subject, body, path_search, start_date, end_date
-    )
+    try:
+        results, total_count, next_cursor = search_emails(**criteria, cursor=cursor, page_size=page_size)
+        error = None
+    except QueryError as e:
+        results, total_count, next_cursor = [], 0, None
+        error = str(e)
+    search_query, sender, recipient, participant, subject, body, path_search, start_date, end_date = criteria.values()
 
     # Build search criteria display text (Jinja2 will auto-escape, so we don't escape here)
     criteria_parts = []
@@ -117,16 +787,138 @@ def search():
     search_criteria_text = " | ".join(criteria_parts)
 
     # Build result count text
-    if total_count > 1000:
-        count_text = f"Found {total_count:,} result(s) (showing first 1000)"
+    if error:
+        count_text = f"Invalid search: {error}"
+    elif total_count > page_size:
+        count_text = f"Found {total_count:,} result(s) (showing {page_size:,} per page)"
     else:
         count_text = f"Found {total_count:,} result(s)"
 
-    return render_template(
-        "search_results.html",
-        results=results,
-        search_criteria_text=search_criteria_text,
-        count_text=count_text
+    # Links to the next page and back to the newest results keep every other search argument
+    search_args = {k: v for k, v in request.args.items() if k != "cursor"}
+    next_url = url_for("search", **search_args, cursor=next_cursor) if next_cursor else None
+    first_url = url_for("search", **search_args) if cursor else None
+
+    with timed("render"):
+        return render_template(
+            "search_results.html",
+            results=results,
+            search_criteria_text=search_criteria_text,
+            count_text=count_text,
+            next_url=next_url,
+            first_url=first_url,
+        ), 400 if error else 200
+
+
+@app.route("/api/search")
+def api_search():
+    """Search emails and return one page of results as JSON"""
+    criteria = get_search_criteria()
+    if not any(criteria.values()):
+        return jsonify(error="At least one search parameter is required"), 400
+
+    try:
+        results_df, total_count, next_cursor = search_page(
+            **criteria, cursor=request.args.get("cursor", "").strip(), page_size=get_page_size()
+        )
+    except QueryError as e:
+        return jsonify(error=str(e)), 400
+    results = results_df.with_columns(pl.col("date").dt.to_string("%Y-%m-%dT%H:%M:%S%:z")).rename({"body": "snippet"})
+    return jsonify(total_count=total_count, next_cursor=next_cursor, results=results.to_dicts())
+
+
+def export_batches(row_ids: pl.Series) -> Iterator[pl.DataFrame]:
+    """
+    Fetch the given email rows (sorted by row id) in batches of up to EXPORT_BATCH_SIZE rows.
+    Always yields at least one (possibly empty) batch.
+    """
+    if BACKEND == "lazy":
+        # Fetch a whole row group at a time so each one is only decoded once
+        cuts = row_ids.search_sorted(pl.Series(get_row_group_offsets(), dtype=row_ids.dtype)).to_list()
+    else:
+        cuts = list(range(0, len(row_ids), EXPORT_BATCH_SIZE)) + [len(row_ids)]
+
+    empty = True
+    for start, end in zip(cuts, cuts[1:]):
+        if end > start:
+            rows = fetch_rows(row_ids.slice(start, end - start))
+            for offset in range(0, len(rows), EXPORT_BATCH_SIZE):
+                yield rows.slice(offset, EXPORT_BATCH_SIZE)
+                empty = False
+    if empty:
+        yield fetch_rows(row_ids.head(0))
+
+
+def export_ndjson(batches: Iterator[pl.DataFrame]) -> Iterator[str]:
+    """Serialize batches of email rows as newline-delimited JSON"""
+    for batch in batches:
+        if len(batch) > 0:
+            yield batch.write_ndjson()
+
+
+def export_csv(batches: Iterator[pl.DataFrame]) -> Iterator[str]:
+    """Serialize batches of email rows as CSV with a single header line"""
+    for i, batch in enumerate(batches):
+        yield batch.write_csv(include_header=i == 0)
+
+
+def export_arrow(batches: Iterator[pl.DataFrame]) -> Iterator[bytes]:
+    """Serialize batches of email rows as one Arrow IPC stream"""
+    sink = io.BytesIO()
+    writer = None
+    for batch in batches:
+        table = batch.to_arrow()
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    writer.close()  # Writes the end-of-stream marker
+    yield sink.getvalue()
+
+
+@app.route("/api/export")
+def api_export():
+    """Stream every email matching the search (in corpus order) as NDJSON, CSV or Arrow IPC"""
+    export_format = request.args.get("format", "ndjson").strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(error=f"Unknown export format, expected one of: {', '.join(EXPORT_FORMATS)}"), 400
+
+    # Row ids in corpus order, so each batch reads a contiguous run of the Parquet file
+    try:
+        row_ids = find_matches(**get_search_criteria())["row_id"].sort()
+    except QueryError as e:
+        return jsonify(error=str(e)), 400
+    serializers = {"ndjson": export_ndjson, "csv": export_csv, "arrow": export_arrow}
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    return Response(
+        stream_with_context(serializers[export_format](export_batches(row_ids))),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename=enron_export.{extension}",
+            "X-Total-Count": str(len(row_ids)),
+        },
+    )
+
+
+@app.route("/metrics")
+def metrics():
+    """Export request and stage timings in the Prometheus text format"""
+    return Response(format_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/cache_stats")
+def cache_stats():
+    """Report search cache hit/miss counters as JSON"""
+    with _search_cache_lock:
+        stats = dict(_search_cache_stats, size=len(_search_cache))
+    return jsonify(
+        **stats,
+        max_size=SEARCH_CACHE_SIZE,
+        ttl=SEARCH_CACHE_TTL,
+        shared_dir=SEARCH_CACHE_DIR or None,
+        shared_dir_max_size=SEARCH_CACHE_DIR_SIZE if SEARCH_CACHE_DIR else None,
     )
 
 
@@ -136,6 +928,7 @@ def email():
     email_path = request.args.get("path", "").strip()
     from_search = request.args.get("from_search", "0") == "1"
     random_type = request.args.get("random_type", "").strip()  # "random" or "random_today" or ""
+    unique = request.args.get("unique", "0") == "1"  # Random picks skip duplicates
 
     if not email_path:
         return "Email path required", 400
@@ -145,7 +938,7 @@ def email():
         email_path = email_path + '.'
 
     # Get email from dataframe
-    email_data = get_email(email_path)
+    email_data = get_email(email_path, EMAIL_DETAIL_COLUMNS)
 
     if email_data is None:
         return "Email not found", 404
@@ -153,22 +946,7 @@ def email():
     path, email_date, email_subject, email_sender, email_recipient, email_body = email_data
 
     # Format values for template (Jinja2 will auto-escape, so we don't escape here)
-    if email_date:
-        if isinstance(email_date, datetime):
-            # Subtract 5 hours for timezone adjustment
-            adjusted_date = email_date - timedelta(hours=5)
-            date_str = adjusted_date.strftime("%Y-%m-%d %I:%M %p")
-        else:
-            # Try to parse and reformat if it's a string
-            try:
-                dt = datetime.fromisoformat(str(email_date).replace('Z', '+00:00'))
-                # Subtract 5 hours for timezone adjustment
-                adjusted_date = dt - timedelta(hours=5)
-                date_str = adjusted_date.strftime("%Y-%m-%d %I:%M %p")
-            except (ValueError, AttributeError):
-                date_str = str(email_date)
-    else:
-        date_str = "N/A"
+    date_str = email_date if email_date else "N/A"
     sender_str = email_sender if email_sender else "N/A"
     recipient_str = email_recipient if email_recipient else "N/A"
     subject_str = email_subject if email_subject else "(no subject)"
@@ -216,51 +994,293 @@ def email():
         body_content_html = ""
         body_content_raw = ""
 
-    return render_template(
-        "email_detail.html",
-        path=path_str,
-        date=date_str,
-        sender=sender_str,
-        recipient=recipient_str,
-        subject=subject_str,
-        is_html=is_html,
-        body_content=body_content_html,
-        body_content_raw=body_content_raw,
-        body_content_original=body_content_original,
-        body_content_formatted=body_content_formatted,
-        from_search=from_search,
-        random_type=random_type
-    )
+    with timed("render"):
+        return render_template(
+            "email_detail.html",
+            path=path_str,
+            date=date_str,
+            sender=sender_str,
+            recipient=recipient_str,
+            subject=subject_str,
+            is_html=is_html,
+            body_content=body_content_html,
+            body_content_raw=body_content_raw,
+            body_content_original=body_content_original,
+            body_content_formatted=body_content_formatted,
+            from_search=from_search,
+            random_type=random_type,
+            unique=unique,
+        )
 
 
 @app.route("/random")
 def random_email():
-    """Serve a random email"""
-    email_data = get_random_email()
+    """Serve a random email (unique=1 skips all but the newest email of each group of duplicates)"""
+    unique = request.args.get("unique", "0") == "1"
+    row_index = random_row(unique)
 
-    if email_data is None:
+    if row_index is None:
         return "No emails found", 404
 
-    path = email_data[0]
-    encoded_path = urllib.parse.quote(path)
-    return redirect(url_for("email", path=encoded_path, random_type="random"))
+    encoded_path = urllib.parse.quote(get_paths()[row_index])
+    return redirect(url_for("email", path=encoded_path, random_type="random", unique=1 if unique else None))
 
 
 @app.route("/random_today")
 def random_today_email():
     """Serve a random email from today's date (any year)"""
-    email_data = get_random_today_email()
+    unique = request.args.get("unique", "0") == "1"
+    row_index = random_today_row(unique)
 
-    if email_data is None:
+    if row_index is None:
         today = date.today()
         return f"No emails found for {today.strftime('%B %d')}", 404
 
-    path = email_data[0]
-    encoded_path = urllib.parse.quote(path)
-    return redirect(url_for("email", path=encoded_path, random_type="random_today"))
+    encoded_path = urllib.parse.quote(get_paths()[row_index])
+    return redirect(url_for("email", path=encoded_path, random_type="random_today", unique=1 if unique else None))
 
 
-def search_emails(
+def encode_cursor(date_val: datetime, path: str) -> str:
+    """Encode the (date, path) of the last result on a page as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(f"{date_val.isoformat()}|{path}".encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime, str]]:
+    """Decode a pagination cursor, or None if it is empty or malformed"""
+    try:
+        date_str, path = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        date_val = datetime.fromisoformat(date_str)
+    except ValueError:
+        return None
+    # Cursors carry the UTC offset of the (time zone aware) date column, a naive date can't be compared with it
+    if date_val.tzinfo is None:
+        return None
+    return date_val, path
+
+
+class QueryError(ValueError):
+    """A search that can't be parsed, or a regular expression that is invalid or too expensive"""
+
+
+# Query tokens: parentheses, quoted phrases (the closing quote may be missing) and words
+QUERY_TOKEN_PATTERN = re.compile(r'[()]|"[^"]*"?|[^\s()"]+')
+REGEX_REPEAT_PATTERN = re.compile(r"\{(\d+)(?:,(\d*))?\}")
+DATE_BOUND_PATTERN = re.compile(r"(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?")
+
+# Query syntax trees are nested tuples, so equivalent searches compare equal and can share a cache entry:
+#   ("term", columns, text, is_regex)  text occurs in one of the columns (lowercase, unless a regex)
+#   ("date", start, end)               start <= date < end, either bound may be None
+#   ("and", children), ("or", children), ("not", child)
+QueryNode = Tuple
+
+
+def parse_date_bound(text: str, end: bool) -> datetime:
+    """
+    Parse a YYYY, YYYY-MM or YYYY-MM-DD date as a UTC datetime: its first day, or with end=True
+    the day after its last day (date ranges include their end)
+    """
+    match = DATE_BOUND_PATTERN.fullmatch(text)
+    if match is None:
+        raise QueryError(f"Invalid date {text!r}, expected YYYY-MM-DD")
+    year, month, day = (int(part) if part else None for part in match.groups())
+    try:
+        if day is not None:
+            first = date(year, month, day)
+            after = first + timedelta(days=1)
+        elif month is not None:
+            first = date(year, month, 1)
+            after = date(year + month // 12, month % 12 + 1, 1)
+        else:
+            first = date(year, 1, 1)
+            after = date(year + 1, 1, 1)
+    except (ValueError, OverflowError):
+        raise QueryError(f"Invalid date {text!r}") from None
+    return datetime.combine(after if end else first, datetime.min.time(), tzinfo=timezone.utc)
+
+
+def parse_date_range(text: str) -> QueryNode:
+    """Parse the value of a date: term, a date or an inclusive FROM..TO range with either end optional"""
+    first, dots, last = text.partition("..")
+    if not dots:
+        first = last = text
+    if not first and not last:
+        raise QueryError("Empty date range")
+    return (
+        "date",
+        parse_date_bound(first, end=False) if first else None,
+        parse_date_bound(last, end=True) if last else None,
+    )
+
+
+def expanded_regex_size(pattern: str) -> int:
+    """Length of a regex with its counted repeats written out, counting escapes and character classes as one"""
+    groups: List[List[int]] = [[]]  # Sizes of the items of each open group
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        repeat = REGEX_REPEAT_PATTERN.match(pattern, i)
+        if repeat:
+            if groups[-1]:
+                groups[-1][-1] *= max(int(count) for count in repeat.groups() if count)
+            i = repeat.end()
+            continue
+        if char == "\\":
+            # \p{Greek} and \x{2014} escapes are one item too
+            end = pattern.find("}", i) + 1 if pattern[i + 1 : i + 3] in ("p{", "P{", "x{", "u{", "U{") else i + 2
+            groups[-1].append(1)
+            i = max(end, i + 2)
+            continue
+        if char == "[":
+            # Skip to the end of the class, which may contain nested classes and escapes
+            depth = 0
+            while i < len(pattern):
+                if pattern[i] == "\\":
+                    i += 1
+                elif pattern[i] == "[":
+                    depth += 1
+                elif pattern[i] == "]" and depth > 0:
+                    depth -= 1
+                    if depth == 0:
+                        break
+                i += 1
+            groups[-1].append(1)
+        elif char == "(":
+            groups.append([])
+        elif char == ")" and len(groups) > 1:
+            group = groups.pop()
+            groups[-1].append(sum(group))
+        elif char not in "*+?|^$":
+            groups[-1].append(1)
+        i += 1
+    return sum(sum(group) for group in groups)
+
+
+def check_regex(pattern: str) -> None:
+    """Reject a regular expression that is invalid or could compile to a very large automaton"""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise QueryError(f"Regular expressions are limited to {MAX_REGEX_LENGTH} characters")
+    if expanded_regex_size(pattern) > MAX_REGEX_SIZE:
+        raise QueryError(f"Regular expression {pattern!r} is too complex, try smaller repeat counts")
+    try:
+        pl.select(pl.lit("").str.contains(pattern))
+    except pl.exceptions.PolarsError:
+        raise QueryError(f"Invalid regular expression {pattern!r}") from None
+
+
+def make_term(columns: Tuple[str, ...], text: str, regex: bool) -> QueryNode:
+    """Build a term node, searching for text literally unless it is a regex with regex syntax"""
+    if not text:
+        raise QueryError("Empty search term")
+    if regex and set(text) & REGEX_METACHARACTERS:
+        check_regex(text)
+        return ("term", columns, text, True)
+    return ("term", columns, text.lower(), False)
+
+
+def combine(operator: str, children: List[QueryNode]) -> QueryNode:
+    """Build an "and" or "or" node, merging in nested nodes of the same kind"""
+    flattened: List[QueryNode] = []
+    for child in children:
+        for node in child[1] if child[0] == operator else [child]:
+            if node not in flattened:
+                flattened.append(node)
+    return flattened[0] if len(flattened) == 1 else (operator, tuple(flattened))
+
+
+class QueryParser:
+    """Recursive descent parser for the search query language (see parse_query)"""
+
+    def __init__(self, text: str) -> None:
+        self.tokens = [(match.group(), match.start(), match.end()) for match in QUERY_TOKEN_PATTERN.finditer(text)]
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self) -> Optional[str]:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def take_attached(self) -> Optional[str]:
+        """Take the next token if there is no space before it (the value of "from:" or "-" in 'from:"a b"')"""
+        if self.peek() not in (None, ")") and self.tokens[self.position][1] == self.tokens[self.position - 1][2]:
+            return self.take()
+        return None
+
+    def parse_or(self, columns: Tuple[str, ...]) -> QueryNode:
+        children = [self.parse_and(columns)]
+        while self.peek() == "OR":
+            self.take()
+            children.append(self.parse_and(columns))
+        return combine("or", children)
+
+    def parse_and(self, columns: Tuple[str, ...]) -> QueryNode:
+        children = [self.parse_not(columns)]
+        while self.peek() not in (None, ")", "OR"):
+            if self.peek() == "AND":
+                self.take()
+            children.append(self.parse_not(columns))
+        return combine("and", children)
+
+    def parse_not(self, columns: Tuple[str, ...]) -> QueryNode:
+        token = self.take()
+        if token is None or token in (")", "AND", "OR"):
+            raise QueryError(f"Expected a search term before {token!r}" if token else "Expected a search term at the end")
+        if token == "NOT":
+            return ("not", self.parse_not(columns))
+        if token.startswith("-") and token != "-":
+            return ("not", self.parse_term(token[1:], columns))
+        if token == "-" and (attached := self.take_attached()) is not None:
+            return ("not", self.parse_term(attached, columns))
+        return self.parse_term(token, columns)
+
+    def parse_term(self, token: str, columns: Tuple[str, ...]) -> QueryNode:
+        if token == "(":
+            node = self.parse_or(columns)
+            if self.take() != ")":
+                raise QueryError("Missing )")
+            return node
+        if token.startswith('"'):
+            return make_term(columns, token[1:-1] if len(token) > 1 and token.endswith('"') else token[1:], False)
+
+        name, colon, value = token.partition(":")
+        field = name.lower()
+        if colon and (field in QUERY_FIELDS or field == "date"):
+            token = value or self.take_attached() or ""
+            if not token:
+                raise QueryError(f"Missing value after {name}:")
+            if field == "date":
+                return parse_date_range(token.strip('"'))
+            return self.parse_term(token, QUERY_FIELDS[field])
+        if token.startswith("~"):
+            # Opt-in regular expression: ~pattern or ~"pattern with spaces"
+            pattern = token[1:] or self.take_attached() or ""
+            if pattern.startswith('"'):
+                pattern = pattern[1:-1] if len(pattern) > 1 and pattern.endswith('"') else pattern[1:]
+            return make_term(columns, pattern, True)
+        return make_term(columns, token, False)
+
+
+@lru_cache(maxsize=1024)
+def parse_query(text: str, columns: Tuple[str, ...]) -> Optional[QueryNode]:
+    """
+    Parse the text of a search box into a query syntax tree, or None if it is empty.
+    Terms are case-insensitive substrings of the given columns, searched for literally. Terms may be quoted
+    "phrases", prefixed with a field (from:, to:, participant:, subject:, body:, path:) or written as a
+    ~regex, and date: takes a YYYY[-MM[-DD]] date or FROM..TO range. Terms must all match unless combined
+    with OR; NOT or - excludes a term, and parentheses group.
+    """
+    parser = QueryParser(text)
+    if parser.peek() is None:
+        return None
+    node = parser.parse_or(columns)
+    if parser.peek() is not None:
+        raise QueryError(f"Unexpected {parser.peek()!r}")
+    return node
+
+
+def compile_search(
     query: str = "",
     sender: str = "",
     recipient: str = "",
@@ -270,144 +1290,399 @@ def search_emails(
     path_search: str = "",
     start_date: str = "",
     end_date: str = "",
-) -> Tuple[List[Tuple], int]:
-    """Search emails in the parquet file with field-specific or general search"""
-    df = get_dataframe()
-
-    # Build filters
-    filters = []
-
-    # Quick search across all fields
-    if query:
-        query_lower = query.lower()
-        filters.append(
-            (pl.col("subject").str.to_lowercase().str.contains(query_lower, literal=False))
-            | (pl.col("sender").str.to_lowercase().str.contains(query_lower, literal=False))
-            | (pl.col("recipient").str.to_lowercase().str.contains(query_lower, literal=False))
-            | (pl.col("body").str.to_lowercase().str.contains(query_lower, literal=False))
-        )
-
-    # Field-specific searches
-    if sender:
-        filters.append(pl.col("sender").str.to_lowercase().str.contains(sender.lower(), literal=False))
-
-    if recipient:
-        filters.append(pl.col("recipient").str.to_lowercase().str.contains(recipient.lower(), literal=False))
-
-    if participant:
-        participant_lower = participant.lower()
-        filters.append(
-            (pl.col("sender").str.to_lowercase().str.contains(participant_lower, literal=False))
-            | (pl.col("recipient").str.to_lowercase().str.contains(participant_lower, literal=False))
-        )
-
-    if subject:
-        filters.append(pl.col("subject").str.to_lowercase().str.contains(subject.lower(), literal=False))
-
-    if body:
-        filters.append(pl.col("body").str.to_lowercase().str.contains(body.lower(), literal=False))
-
-    if path_search:
-        filters.append(pl.col("path").str.to_lowercase().str.contains(path_search.lower(), literal=False))
-
-    # Date filtering
-    if start_date:
-        start_dt = date(year=int(start_date[:4]), month=int(start_date[5:7]), day=int(start_date[8:10]))
-        # Convert date to timezone-aware datetime (UTC) for comparison
-        start_datetime = datetime.combine(start_dt, datetime.min.time(), tzinfo=timezone.utc)
-        filters.append(pl.col("date") >= start_datetime)
-
-    if end_date:
-        # Add one day to make it inclusive
-        end_dt = date(year=int(end_date[:4]), month=int(end_date[5:7]), day=int(end_date[8:10])) + timedelta(days=1)
-        # Convert date to timezone-aware datetime (UTC) for comparison
-        end_datetime = datetime.combine(end_dt, datetime.min.time(), tzinfo=timezone.utc)
-        filters.append(pl.col("date") < end_datetime)
-
-    # Apply all filters
+) -> Optional[QueryNode]:
+    """Parse the search boxes into one query that matches the emails matching every box, or None if all are empty"""
+    nodes = [
+        parse_query(text, columns)
+        for text, columns in [
+            (query, QUICK_SEARCH_FIELDS),
+            (sender, QUERY_FIELDS["sender"]),
+            (recipient, QUERY_FIELDS["recipient"]),
+            (participant, QUERY_FIELDS["participant"]),
+            (subject, QUERY_FIELDS["subject"]),
+            (body, QUERY_FIELDS["body"]),
+            (path_search, QUERY_FIELDS["path"]),
+        ]
+    ]
+    if start_date or end_date:
+        nodes.append((
+            "date",
+            parse_date_bound(start_date, end=False) if start_date else None,
+            parse_date_bound(end_date, end=True) if end_date else None,
+        ))
+    nodes = [node for node in nodes if node is not None]
+    return combine("and", nodes) if nodes else None
+
+
+def query_expr(node: QueryNode, columns: List[str]) -> pl.Expr:
+    """Compile a query syntax tree into a filter expression"""
+    kind = node[0]
+    if kind == "term":
+        _, fields, text, regex = node
+        # The columns are lowercase, regexes match case-insensitively so their escapes keep their meaning
+        pattern = f"(?i){text}" if regex else text
+        return pl.any_horizontal([lowercase_col(columns, f).str.contains(pattern, literal=not regex) for f in fields])
+    if kind == "date":
+        _, start, end = node
+        bounds = []
+        if start is not None:
+            bounds.append(pl.col("date") >= start)
+        if end is not None:
+            bounds.append(pl.col("date") < end)
+        return pl.all_horizontal(bounds)
+    if kind == "not":
+        # A missing value doesn't contain the term
+        return ~query_expr(node[1], columns).fill_null(False)
+    if kind == "and":
+        return pl.all_horizontal([query_expr(child, columns) for child in node[1]])
+
+    # OR: the literal terms on the same columns are all searched for in one pass over each column
+    literals: Dict[Tuple[str, ...], List[str]] = {}
+    alternatives = []
+    for child in node[1]:
+        if child[0] == "term" and not child[3]:
+            literals.setdefault(child[1], []).append(child[2])
+        else:
+            alternatives.append(query_expr(child, columns))
+    for fields, texts in literals.items():
+        if len(texts) == 1:
+            alternatives.append(query_expr(("term", fields, texts[0], False), columns))
+        else:
+            alternatives.append(pl.any_horizontal([lowercase_col(columns, f).str.contains_any(texts) for f in fields]))
+    return pl.any_horizontal(alternatives)
+
+
+def query_candidates(
+    node: QueryNode, index: Optional[pl.DataFrame], address_index: Optional[pl.DataFrame], max_rows: int
+) -> Optional[pl.Series]:
+    """
+    Find the rows that may match a query (a superset, the filters are re-checked) with the inverted index
+    and the address index. Returns None if the indexes can't narrow it down to at most max_rows rows.
+    """
+    kind = node[0]
+    if kind == "term":
+        _, fields, text, regex = node
+        if regex:
+            return None
+        postings = None
+        if address_index is not None and set(fields) <= set(ADDRESS_COLUMNS):
+            postings = address_postings(address_index, text, list(fields), max_rows)
+        if postings is None and index is not None and set(fields) <= set(INDEXED_COLUMNS):
+            postings = search_index(index, text, literal=True)
+        # Postings covering most of the corpus narrow nothing, a plain scan is cheaper
+        return postings.cast(pl.UInt32) if postings is not None and len(postings) <= max_rows else None
+    if kind == "and":
+        candidates = None
+        for child in node[1]:
+            postings = query_candidates(child, index, address_index, max_rows)
+            if postings is not None:
+                candidates = postings if candidates is None else candidates.filter(candidates.is_in(postings.implode()))
+        return candidates
+    if kind == "or":
+        alternatives = []
+        for child in node[1]:
+            postings = query_candidates(child, index, address_index, max_rows)
+            if postings is None:
+                return None
+            alternatives.append(postings)
+        candidates = pl.concat(alternatives).unique().sort()
+        return candidates if len(candidates) <= max_rows else None
+    return None  # NOT and date terms don't narrow by row
+
+
+def find_matches(
+    query: str = "",
+    sender: str = "",
+    recipient: str = "",
+    participant: str = "",
+    subject: str = "",
+    body: str = "",
+    path_search: str = "",
+    start_date: str = "",
+    end_date: str = "",
+) -> pl.DataFrame:
+    """
+    Find emails matching the search with field-specific or general search (see parse_query for the
+    query language of the search boxes), keeping only the newest email of each group of duplicates.
+    Returns: DataFrame of (row_id, date) for every match, in no particular order
+    """
+    columns = get_columns()
+    query_node = compile_search(
+        query, sender, recipient, participant, subject, body, path_search, start_date, end_date
+    )
+    conjuncts = [] if query_node is None else list(query_node[1]) if query_node[0] == "and" else [query_node]
+
+    # Narrow the search to candidate rows using the inverted index and the address index
+    # (the filters are re-checked below)
+    candidates = None
+    if query_node is not None:
+        with timed("search.index"):
+            candidates = query_candidates(query_node, get_search_index(), get_address_index(), get_total_count() // 2)
+
+    # One filter for each part of the query that must match
+    filters = [query_expr(node, columns) for node in conjuncts]
+
+    # The date range and the folders every match lies in, for skipping shards
+    dates = [node for node in conjuncts if node[0] == "date"]
+    start_datetime = max((node[1] for node in dates if node[1] is not None), default=None)
+    end_datetime = min((node[2] for node in dates if node[2] is not None), default=None)
+    path_terms = [node[2] for node in conjuncts if node[0] == "term" and node[1] == QUERY_FIELDS["path"] and not node[3]]
+
+    # With a body store, filters on the metadata run first and only the remaining rows' bodies are read
+    body_filters = [f for f in filters if in_body_store(f)]
+    filters = [f for f in filters if not in_body_store(f)]
+
+    # Keep the most recent email for each (subject, body) pair
+    # (on the precomputed integer dedupe key when the corpus has one)
+    dedupe_subset = dedupe_key(columns)
+    # Columns read by the filters and the deduplication
+    needed = ["row_id", "date", *dedupe_subset]
+    for f in filters + body_filters:
+        for name in f.meta.root_names():
+            if name not in needed:
+                needed.append(name)
+
+    # Apply all filters to each shard that can hold matches; the shards are scanned in parallel
+    shards = scan_shards(
+        candidates, start_datetime, end_datetime, path_terms, [c for c in needed if not in_body_store(c)]
+    )
     if filters:
         combined_filter = filters[0]
         for f in filters[1:]:
             combined_filter = combined_filter & f
-        filtered_df = df.filter(combined_filter)
+        shards = [shard.filter(combined_filter) for shard in shards]
+    filtered = pl.concat(shards)
+
+    # Body store columns are only read for the rows that passed the metadata filters
+    body_store_columns = [c for c in needed if in_body_store(c)]
+    if body_store_columns:
+        with timed("search.bodies"):
+            matches = filtered.select([c for c in needed if not in_body_store(c)]).collect()
+            bodies = read_rows(BODY_FILE, matches["row_id"], body_store_columns)
+        filtered = matches.lazy().join(bodies.lazy(), on="row_id", how="left", maintain_order="left")
+        if body_filters:
+            filtered = filtered.filter(pl.all_horizontal(body_filters))
+    deduplicated = deduplicate(filtered.select("row_id", "date", *dedupe_subset), dedupe_subset)
+    # Filtering and deduplication run as one query plan
+    with timed("search.filter"):
+        return deduplicated.collect()
+
+
+def deduplicate(emails: pl.LazyFrame, dedupe_subset: List[str]) -> pl.LazyFrame:
+    """Keep the newest email of each group of duplicates from (row_id, date, *dedupe_subset) rows in corpus order"""
+    if is_date_sorted():
+        # Matches already come out oldest first (row ids ascending), so the last row of each group is its newest
+        deduplicated = emails.unique(subset=dedupe_subset, keep="last", maintain_order=True)
     else:
-        filtered_df = df
+        deduplicated = emails.group_by(dedupe_subset).agg(
+            pl.col("row_id").get(pl.col("date").arg_max()),
+            pl.col("date").max(),
+        )
+    return deduplicated.select("row_id", "date")
+
 
-    # Sort by date descending first, then deduplicate to keep the most recent email for each (subject, body) pair
-    sorted_df = filtered_df.sort("date", descending=True)
-    deduplicated_df = sorted_df.unique(subset=["subject", "body"], keep="first")
-    
-    # Get deduplicated count
+def find_emails(
+    query: str = "",
+    sender: str = "",
+    recipient: str = "",
+    participant: str = "",
+    subject: str = "",
+    body: str = "",
+    path_search: str = "",
+    start_date: str = "",
+    end_date: str = "",
+    cursor: Optional[Tuple[datetime, str]] = None,
+    limit: int = PAGE_SIZE,
+) -> Tuple[pl.Series, int]:
+    """
+    Find emails matching the search with field-specific or general search.
+    Results are ordered newest first by (date, path); cursor is the (date, path) of the last result
+    already shown, only older results are returned.
+    Returns: (row ids of the next `limit` deduplicated matches, total deduplicated match count)
+    """
+    deduplicated_df = find_matches(
+        query, sender, recipient, participant, subject, body, path_search, start_date, end_date
+    )
     total_count = len(deduplicated_df)
-    
-    # Sort again by date descending to ensure newest emails are first, then limit to 1000 results
-    results_df = deduplicated_df.sort("date", descending=True).head(1000)
-    
-    # Convert to list of tuples matching the original format
-    # Column order: path, date, subject, sender, recipient, body
-    # Format dates as strings for template rendering
-    results = []
-    
-    for row in results_df.iter_rows(named=False):
-        date_val = row[1]
-        if date_val:
-            # Format datetime to show only date part
-            if isinstance(date_val, datetime):
-                # Subtract 5 hours for timezone adjustment before formatting date
-                adjusted_date = date_val - timedelta(hours=5)
-                date_str = adjusted_date.strftime("%Y-%m-%d")
-            else:
-                date_str = str(date_val).split()[0] if " " in str(date_val) else str(date_val)
-        else:
-            date_str = None
-        
-        results.append((row[0], date_str, row[2], row[3], row[4], row[5]))  # path, date, subject, sender, recipient, body
 
-    return results, total_count
+    # Keyset pagination: skip everything up to the cursor, then only the next page gets sorted.
+    # Paths break ties between emails with the same date (and stay valid if the corpus is re-imported).
+    with timed("search.paginate"):
+        page = deduplicated_df
+        window = limit
+        if cursor is not None:
+            cursor_date, cursor_path = cursor
+            page = page.filter(pl.col("date") <= cursor_date)
+            window += (page["date"] == cursor_date).sum()  # These may still be before the cursor
+        # Only rows from the window-th newest date up can make the page, so only their paths are looked up
+        if len(page) > window:
+            page = page.filter(pl.col("date") >= page["date"].top_k(window).min())
+        page = page.with_columns(path=get_paths().gather(page["row_id"]))
+        if cursor is not None:
+            page = page.filter((pl.col("date") < cursor_date) | (pl.col("path") < cursor_path))
+        row_ids = page.top_k(limit, by=["date", "path"]).sort(["date", "path"], descending=True)["row_id"]
+    return row_ids, total_count
+
+
+def search_page(
+    query: str = "",
+    sender: str = "",
+    recipient: str = "",
+    participant: str = "",
+    subject: str = "",
+    body: str = "",
+    path_search: str = "",
+    start_date: str = "",
+    end_date: str = "",
+    cursor: str = "",
+    page_size: int = PAGE_SIZE,
+) -> Tuple[pl.DataFrame, int, Optional[str]]:
+    """
+    Search emails in the parquet file with field-specific or general search.
+    Returns: (one page of result rows with body snippets, total count, cursor for the next page or None)
+    """
+    decoded_cursor = decode_cursor(cursor)
+    if cursor and decoded_cursor is None:
+        raise QueryError("Invalid page cursor")
+
+    # Searches that parse to the same query (e.g. differently-cased text) share a cache entry
+    cache_key = (
+        compile_search(query, sender, recipient, participant, subject, body, path_search, start_date, end_date),
+        cursor,
+        page_size,
+    )
+    cached = search_cache_get(cache_key)
+    if cached is not None:
+        row_ids, total_count = cached
+    else:
+        # One extra row tells whether there is a next page
+        row_ids, total_count = find_emails(
+            query, sender, recipient, participant, subject, body, path_search, start_date, end_date,
+            cursor=decoded_cursor, limit=page_size + 1,
+        )
+        search_cache_put(cache_key, row_ids, total_count)
 
+    with timed("search.fetch"):
+        results_df = fetch_rows(row_ids.head(page_size), SNIPPET_COLUMNS)
+    next_cursor = None
+    if len(row_ids) > page_size:
+        last_path, last_date = results_df.row(-1)[:2]
+        next_cursor = encode_cursor(last_date, last_path)
+    return results_df, total_count, next_cursor
 
-def get_email(path: str) -> Optional[Tuple]:
-    """Get a single email by path"""
-    df = get_dataframe()
-    result = df.filter(pl.col("path") == path)
 
-    if len(result) == 0:
-        return None
+def search_emails(
+    query: str = "",
+    sender: str = "",
+    recipient: str = "",
+    participant: str = "",
+    subject: str = "",
+    body: str = "",
+    path_search: str = "",
+    start_date: str = "",
+    end_date: str = "",
+    cursor: str = "",
+    page_size: int = PAGE_SIZE,
+) -> Tuple[List[Tuple], int, Optional[str]]:
+    """Search emails and format one page of results for the search results template"""
+    results_df, total_count, next_cursor = search_page(
+        query, sender, recipient, participant, subject, body, path_search, start_date, end_date,
+        cursor=cursor, page_size=page_size,
+    )
 
-    row = result.row(0, named=False)
-    return (row[0], row[1], row[2], row[3], row[4], row[5])  # path, date, subject, sender, recipient, body
+    # Tuples of (path, local date, subject, sender, recipient, single-line body snippet) for the template
+    with timed("search.format"):
+        results = results_df.with_columns(
+            pl.col("date").dt.convert_time_zone(DISPLAY_TIME_ZONE).dt.strftime("%Y-%m-%d"),
+            pl.col("body").str.replace_all("\r", "", literal=True).str.replace_all("\n", " ", literal=True),
+        ).rows()
 
+    return results, total_count, next_cursor
 
-def get_random_email() -> Optional[Tuple]:
-    """Get a random email from the dataframe"""
-    df = get_dataframe()
-    result = df.sample(n=1)
 
-    if len(result) == 0:
+def get_email(path: str, columns: List[Union[str, pl.Expr]] = EMAIL_COLUMNS) -> Optional[Tuple]:
+    """Get a single email by path"""
+    with timed("email.lookup"):
+        row_index = find_row(path)
+    if row_index is None:
         return None
 
-    row = result.row(0, named=False)
-    return (row[0], row[1], row[2], row[3], row[4], row[5])  # path, date, subject, sender, recipient, body
+    with timed("email.fetch"):
+        return fetch_row(row_index, columns)  # path, date, subject, sender, recipient, body
 
 
-def get_random_today_email() -> Optional[Tuple]:
-    """Get a random email from today's date (any year)"""
+def get_random_index() -> Tuple[pl.Series, List[int], List[int], pl.Series]:
+    """Get or build the (month, day) bucket index used for random picks (cached)"""
+    global _random_index
+    if _random_index is None:
+        columns = get_columns()
+        dedupe_subset = dedupe_key(columns)
+        if BACKEND == "lazy" or any(in_body_store(c) for c in dedupe_subset):
+            emails = pl.scan_parquet(PARQUET_FILE).with_row_index("row_id")
+        else:
+            emails = scan_emails()
+        emails = emails.select("row_id", "date", *dedupe_subset)
+        newest_rows = deduplicate(emails, dedupe_subset).select(pl.col("row_id").sort()).collect()["row_id"]
+
+        month_day = (pl.col("date").dt.month().cast(pl.Int32) - 1) * 31 + pl.col("date").dt.day().cast(pl.Int32) - 1
+        buckets = (
+            emails.select("row_id", month_day.alias("bucket"))
+            .drop_nulls("bucket")
+            .with_columns(duplicate=~pl.col("row_id").is_in(newest_rows.implode()))
+            .sort("bucket", "duplicate", maintain_order=True)
+            .collect()
+        )
+        offsets = buckets["bucket"].search_sorted(pl.Series(range(DAY_BUCKETS + 1), dtype=pl.Int32)).to_list()
+        newest_counts = [0] * DAY_BUCKETS
+        for bucket, count in buckets.filter(~pl.col("duplicate")).group_by("bucket").len().iter_rows():
+            newest_counts[bucket] = count
+        _random_index = (buckets["row_id"], offsets, newest_counts, newest_rows)
+    return _random_index
+
+
+def random_row(exclude_duplicates: bool = False) -> Optional[int]:
+    """Pick a random row index, optionally only among the newest email of each group of duplicates"""
+    if exclude_duplicates:
+        newest_rows = get_random_index()[3]
+        return newest_rows[random.randrange(len(newest_rows))] if len(newest_rows) > 0 else None
+    total_count = get_total_count()
+    return random.randrange(total_count) if total_count > 0 else None
+
+
+def random_today_row(exclude_duplicates: bool = False) -> Optional[int]:
+    """Pick a random row index among the emails from today's date (any year)"""
+    order, offsets, newest_counts, _ = get_random_index()
     today = date.today()
-    month = today.month
-    day = today.day
+    bucket = (today.month - 1) * 31 + today.day - 1
+    start = offsets[bucket]
+    end = start + newest_counts[bucket] if exclude_duplicates else offsets[bucket + 1]
+    return order[random.randrange(start, end)] if end > start else None
 
-    df = get_dataframe()
-    result = df.filter(
-        (pl.col("date").dt.month() == month) & (pl.col("date").dt.day() == day)
-    ).sample(n=1)
 
-    if len(result) == 0:
+def get_random_email(exclude_duplicates: bool = False) -> Optional[Tuple]:
+    """Get a random email from the dataframe"""
+    row_index = random_row(exclude_duplicates)
+    if row_index is None:
         return None
+    return fetch_row(row_index)  # path, date, subject, sender, recipient, body
+
 
-    row = result.row(0, named=False)
-    return (row[0], row[1], row[2], row[3], row[4], row[5])  # path, date, subject, sender, recipient, body
+def get_random_today_email(exclude_duplicates: bool = False) -> Optional[Tuple]:
+    """Get a random email from today's date (any year)"""
+    row_index = random_today_row(exclude_duplicates)
+    if row_index is None:
+        return None
+    return fetch_row(row_index)  # path, date, subject, sender, recipient, body
 
 
 if __name__ == "__main__":
+    # Load the corpus and indexes up front rather than on the first request
+    get_path_index()
+    get_search_index()
+    get_address_index()
+    get_body_columns()
+    if BACKEND != "lazy":
+        get_shards()
+    get_random_index()
     app.run(debug=True, host="0.0.0.0", port=8000)
 
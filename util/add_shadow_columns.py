@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Add normalized shadow columns and the dedupe key to an existing Parquet corpus.
+Writes lowercase copies of the searchable columns (body_lc, subject_lc, ...) and the
+content_hash/dup_group_id columns, the same as a fresh run of import_emails.py, without
+re-parsing the maildir. The corpus is rewritten in the importer's default layout: sorted
+by date, in row groups of ENRON_ROW_GROUP_SIZE rows, compressed with ENRON_COMPRESSION.
+"""
+
+import os
+
+import polars as pl
+
+from build_search_index import ADDRESS_COLUMNS
+from import_emails import (
+    DEDUPE_COLUMNS,
+    DEFAULT_COMPRESSION,
+    DEFAULT_ROW_GROUP_SIZE,
+    SHADOW_COLUMNS,
+    add_dedupe_columns,
+    add_shadow_columns,
+    write_corpus,
+)
+
+# Configuration
+PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
+ROW_GROUP_SIZE = int(
+    os.environ.get("ENRON_ROW_GROUP_SIZE", str(DEFAULT_ROW_GROUP_SIZE))
+)
+COMPRESSION = os.environ.get("ENRON_COMPRESSION", DEFAULT_COMPRESSION)
+
+
+def main() -> None:
+    """Main execution function."""
+    print("=" * 80)
+    print("Add Shadow Columns")
+    print("=" * 80)
+
+    print(f"\nLoading emails from {PARQUET_FILE}...")
+    df = pl.read_parquet(PARQUET_FILE)
+    print(f"Loaded {len(df):,} emails")
+
+    # Drop any existing shadow columns so they're rebuilt from the source columns, along with the unused
+    # "<name>_addresses" list columns that earlier versions of the importer wrote
+    shadow_columns = [f"{c}_lc" for c in SHADOW_COLUMNS] + [
+        f"{c}_addresses" for c in ADDRESS_COLUMNS
+    ]
+    df = df.drop(shadow_columns + DEDUPE_COLUMNS, strict=False)
+
+    print("Adding shadow columns and dedupe key...")
+    df = add_shadow_columns(add_dedupe_columns(df))
+
+    print(f"Sorting and writing to Parquet file: {PARQUET_FILE}")
+    write_corpus(
+        df.lazy(),
+        PARQUET_FILE,
+        row_group_size=ROW_GROUP_SIZE,
+        compression=COMPRESSION,
+    )
+
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()
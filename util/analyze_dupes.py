@@ -10,6 +10,8 @@ from typing import Dict, List
 
 import polars as pl
 
+from build_search_index import dedupe_key
+
 # Configuration
 PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
 OUTPUT_DIR = Path("analysis")
@@ -23,19 +25,21 @@ def analyze_duplicates(df: pl.DataFrame) -> Dict:
     print("Analyzing duplicates...")
     
     total_emails = len(df)
+    key = dedupe_key(df.columns)
     
     # Count duplicates by subject + body and get a sample path for each group
     duplicate_counts = (
-        df.group_by(["subject", "body"])
+        df.group_by(key)
         .agg([
-            pl.count().alias("count"),
+            pl.len().alias("count"),
             pl.col("path").first().alias("sample_path"),  # Get first path from each group
+            *([pl.col("subject").first()] if "subject" not in key else []),
         ])
         .filter(pl.col("count") > 1)
         .sort("count", descending=True)
     )
     
-    num_unique_emails = df.select(["subject", "body"]).n_unique()
+    num_unique_emails = df.select(key).n_unique()
     num_duplicates = total_emails - num_unique_emails
     num_duplicate_groups = len(duplicate_counts)
     
@@ -112,7 +116,8 @@ def main() -> None:
     
     # Load emails
     print(f"\nLoading emails from {PARQUET_FILE}...")
-    df = pl.read_parquet(PARQUET_FILE)
+    key = dedupe_key(list(pl.read_parquet_schema(PARQUET_FILE)))
+    df = pl.read_parquet(PARQUET_FILE, columns=list(dict.fromkeys(["path", "subject"] + key)))
     print(f"Loaded {len(df):,} emails")
     
     # Analyze duplicates
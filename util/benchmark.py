@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""
+Benchmark the import, search and lookup hot paths on a synthetic corpus.
+Generates an Enron-style maildir of any size offline, times import_emails.py at several worker counts,
+runs a fixed query mix against the viewer's search and lookup functions, and saves the results as a
+JSON baseline that later runs can be compared against.
+
+Usage:
+    python util/benchmark.py generate --emails 50000
+    python util/benchmark.py run --output benchmark/baseline.json
+    python util/benchmark.py compare benchmark/baseline.json benchmark/current.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import polars as pl
+
+# Configuration
+UTIL_DIR = Path(__file__).resolve().parent
+REPO_DIR = UTIL_DIR.parent
+BENCHMARK_DIR = Path("benchmark")
+DEFAULT_SEED = 1337
+
+# Synthetic corpus: mailboxes, folders and vocabulary the query mix below is written against
+MAILBOXES = [
+    "allen-p",
+    "arnold-j",
+    "bass-e",
+    "beck-s",
+    "dasovich-j",
+    "farmer-d",
+    "germany-c",
+    "jones-t",
+    "kaminski-v",
+    "kean-s",
+    "lay-k",
+    "lenhart-m",
+    "mann-k",
+    "nemec-g",
+    "perlingiere-d",
+    "scott-s",
+    "shackleton-s",
+    "skilling-j",
+    "symes-k",
+    "taylor-m",
+    "white-s",
+]
+FOLDERS = [
+    "inbox",
+    "sent",
+    "sent_items",
+    "_sent_mail",
+    "all_documents",
+    "discussion_threads",
+    "deleted_items",
+]
+FIRST_NAMES = [
+    "john",
+    "jane",
+    "mark",
+    "sara",
+    "mike",
+    "kate",
+    "jeff",
+    "vince",
+    "steven",
+    "tana",
+    "chris",
+    "susan",
+]
+SUBJECT_WORDS = [
+    "meeting",
+    "report",
+    "price",
+    "contract",
+    "gas",
+    "power",
+    "deal",
+    "trading",
+    "california",
+    "update",
+    "schedule",
+    "review",
+    "forecast",
+    "credit",
+    "risk",
+    "storage",
+    "pipeline",
+    "agreement",
+    "lunch",
+    "draft",
+]
+BODY_WORDS = SUBJECT_WORDS + [
+    "energy",
+    "market",
+    "please",
+    "thanks",
+    "the",
+    "and",
+    "for",
+    "with",
+    "this",
+    "that",
+    "will",
+    "have",
+    "we",
+    "you",
+    "our",
+    "call",
+    "let",
+    "know",
+    "attached",
+    "regarding",
+    "volume",
+    "curve",
+    "desk",
+    "east",
+    "west",
+    "natural",
+    "electricity",
+    "transmission",
+    "utility",
+    "regulatory",
+    "ferc",
+    "capacity",
+    "mw",
+]
+START_DATE = datetime(1999, 1, 1, tzinfo=timezone(timedelta(hours=-8)))
+DATE_SPAN_MINUTES = 4 * 365 * 24 * 60
+
+# Searches run by the benchmark, as keyword arguments for flask_app.search_emails
+QUERY_MIX = {
+    "quick_search": {"query": "energy"},
+    "quick_search_phrase": {"query": '"natural gas"'},
+    "quick_search_rare": {"query": "ferc"},
+    "sender": {"sender": "lay"},
+    "recipient": {"recipient": "skilling"},
+    "participant": {"participant": "kaminski"},
+    "subject": {"subject": "forecast"},
+    "body": {"body": '"transmission capacity"'},
+    "path": {"path_search": "lay-k/sent"},
+    "date_range": {"start_date": "2001-01-01", "end_date": "2001-06-30"},
+    "quick_search_date_range": {
+        "query": "power",
+        "start_date": "2000-06-01",
+        "end_date": "2001-12-31",
+    },
+}
+
+
+def generate_maildir(
+    maildir_path: Path, num_emails: int, seed: int, duplicate_rate: float
+) -> None:
+    """Write num_emails synthetic emails (some of them copies of earlier ones) in the Enron maildir layout."""
+    rng = random.Random(seed)
+    people = [
+        f"{first}.{mailbox.split('-')[0]}"
+        for mailbox in MAILBOXES
+        for first in rng.sample(FIRST_NAMES, 2)
+    ]
+    owners = {
+        mailbox: f"{rng.choice(FIRST_NAMES)}.{mailbox.split('-')[0]}"
+        for mailbox in MAILBOXES
+    }
+    file_counts: Dict[str, int] = {}
+    messages: List[str] = []
+
+    for i in range(num_emails):
+        mailbox = rng.choice(MAILBOXES)
+        folder = rng.choice(FOLDERS)
+        if messages and rng.random() < duplicate_rate:
+            # The same email filed in a second mailbox/folder, like sent mail also kept in all_documents
+            message = rng.choice(messages)
+        else:
+            sender = owners[mailbox] if "sent" in folder else rng.choice(people)
+            recipients = ", ".join(
+                f"{p}@enron.com"
+                for p in rng.sample(people, rng.choice([1, 1, 1, 2, 3, 8]))
+            )
+            sent_at = START_DATE + timedelta(minutes=rng.randrange(DATE_SPAN_MINUTES))
+            subject = " ".join(
+                rng.choices(SUBJECT_WORDS, k=rng.randint(1, 5))
+            ).capitalize()
+            lines = [
+                " ".join(rng.choices(BODY_WORDS, k=rng.randint(4, 16)))
+                for _ in range(int(rng.lognormvariate(1.5, 1.0)) + 1)
+            ]
+            message = (
+                f"Message-ID: <{i}.{seed}.JavaMail.evans@thyme>\n"
+                f"Date: {format_datetime(sent_at)} (PST)\n"
+                f"From: {sender}@enron.com\n"
+                f"To: {recipients}\n"
+                f"Subject: {subject}\n"
+                "Mime-Version: 1.0\n"
+                "Content-Type: text/plain; charset=us-ascii\n"
+                "Content-Transfer-Encoding: 7bit\n"
+                f"X-From: {sender}\n"
+                f"X-To: {recipients}\n"
+                f"X-Folder: \\{mailbox}\\{folder}\n"
+                f"X-Origin: {mailbox}\n"
+                "\n" + "\n".join(lines) + "\n"
+            )
+            messages.append(message)
+
+        folder_dir = maildir_path / mailbox / folder
+        key = folder_dir.as_posix()
+        if key not in file_counts:
+            folder_dir.mkdir(parents=True, exist_ok=True)
+            file_counts[key] = 0
+        file_counts[key] += 1
+        (folder_dir / f"{file_counts[key]}.").write_text(message)
+
+        if (i + 1) % 10000 == 0 or i + 1 == num_emails:
+            print(f"\r{i + 1} of {num_emails}", end="", flush=True)
+    print()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    # q * n before dividing, so e.g. p95 of 20 values is exactly rank 19 rather than off by a rounding error
+    rank = max(math.ceil(q * len(sorted_values) / 100) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """Latency percentiles (ms) and throughput (operations per second) of a list of timings in seconds"""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "mean_ms": sum(values) / len(values) * 1000,
+        "ops_per_sec": len(values) / sum(values) if sum(values) > 0 else 0.0,
+    }
+
+
+def time_calls(function: Callable[[], Any], iterations: int) -> List[float]:
+    """Call function iterations times and return the duration of each call in seconds"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_rss_mb(usage: resource.struct_rusage) -> float:
+    """Peak resident set size from a rusage result, in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss / scale
+
+
+def run_script(args: List[str], env: Dict[str, str]) -> Dict[str, float]:
+    """Run a util script to completion, returning its wall time and peak RSS (including worker processes)"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, *args],
+        cwd=UTIL_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+    )
+    _, status, usage = os.wait4(
+        process.pid, 0
+    )  # Unlike Popen.wait, also returns the resource usage
+    seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise SystemExit(
+            f"{' '.join(args)} failed with exit status {process.returncode}"
+        )
+    return {"seconds": seconds, "peak_rss_mb": peak_rss_mb(usage)}
+
+
+def benchmark_import(
+    maildir_path: Path,
+    parquet_file: Path,
+    address_index_file: Path,
+    workers_list: List[int],
+) -> Dict[str, Dict[str, float]]:
+    """Time a full import of the maildir at each worker count (the last run's Parquet file is kept)"""
+    num_emails = sum(len(files) for _, _, files in os.walk(maildir_path))
+    results = {}
+    for workers in workers_list:
+        print(f"  import_emails.py --workers {workers}...")
+        result = run_script(
+            [
+                "import_emails.py",
+                "--maildir",
+                str(maildir_path.resolve()),
+                "--parquet",
+                str(parquet_file.resolve()),
+                "--address-index",
+                str(address_index_file.resolve()),
+                "--workers",
+                str(workers),
+            ],
+            env={},
+        )
+        result["emails_per_sec"] = num_emails / result["seconds"]
+        results[f"workers={workers}"] = result
+        print(
+            f"    {result['seconds']:.2f}s, {result['emails_per_sec']:,.0f} emails/s, peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+    return results
+
+
+def benchmark_viewer(iterations: int, seed: int) -> Dict[str, Any]:
+    """Time the query mix and the single email lookups against the viewer's data access functions"""
+    # The viewer reads its configuration from the environment at import time
+    sys.path.insert(0, str(REPO_DIR))
+    import flask_app
+
+    start = time.perf_counter()
+    flask_app.get_email(flask_app.get_paths()[0])
+    flask_app.get_search_index()
+    flask_app.get_address_index()
+    startup_seconds = time.perf_counter() - start
+
+    results: Dict[str, Any] = {"startup_seconds": startup_seconds, "operations": {}}
+    for name, criteria in QUERY_MIX.items():
+        flask_app.search_emails(
+            **criteria
+        )  # Warm up (lazily built structures, page cache)
+        results["operations"][f"search:{name}"] = summarize(
+            time_calls(lambda: flask_app.search_emails(**criteria), iterations)
+        )
+
+    rng = random.Random(seed)
+    paths = flask_app.get_paths()
+    sample = [paths[rng.randrange(len(paths))] for _ in range(iterations * 10)]
+    lookups = iter(sample)
+    results["operations"]["get_email"] = summarize(
+        time_calls(lambda: flask_app.get_email(next(lookups)), len(sample))
+    )
+    results["operations"]["get_random_email"] = summarize(
+        time_calls(flask_app.get_random_email, iterations * 10)
+    )
+    results["operations"]["get_random_today_email"] = summarize(
+        time_calls(flask_app.get_random_today_email, iterations)
+    )
+    results["peak_rss_mb"] = peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+    return results
+
+
+def run(args: argparse.Namespace) -> None:
+    """Import the synthetic maildir, build the search index, benchmark the viewer and save the results."""
+    maildir_path = Path(args.maildir)
+    if not maildir_path.exists():
+        raise SystemExit(
+            f"{maildir_path} not found, create it with: python util/benchmark.py generate"
+        )
+
+    work_dir = Path(args.output).parent
+    work_dir.mkdir(parents=True, exist_ok=True)
+    parquet_file = work_dir / "benchmark.pq"
+    index_file = work_dir / "benchmark_index.pq"
+    address_index_file = work_dir / "benchmark_addresses.pq"
+    body_file = work_dir / "benchmark_bodies.pq"
+
+    print("Benchmarking import...")
+    import_results = benchmark_import(
+        maildir_path, parquet_file, address_index_file, args.workers
+    )
+
+    env = {
+        "ENRON_PARQUET_FILE": str(parquet_file.resolve()),
+        "ENRON_INDEX_FILE": str(index_file.resolve()),
+        "ENRON_ADDRESS_INDEX_FILE": str(address_index_file.resolve()),
+        "ENRON_IPC_FILE": str((work_dir / "benchmark.arrow").resolve()),
+        "ENRON_BODY_FILE": str(body_file.resolve()),
+    }
+    if args.no_index:
+        index_file.unlink(missing_ok=True)
+        address_index_file.unlink(missing_ok=True)
+    else:
+        print("Building search index...")
+        import_results["build_search_index"] = run_script(
+            ["build_search_index.py"], env
+        )
+    if args.body_store:
+        print("Building body store...")
+        import_results["build_body_store"] = run_script(["build_body_store.py"], env)
+    else:
+        body_file.unlink(missing_ok=True)
+    if args.backend == "mmap":
+        print("Converting to Arrow IPC...")
+        import_results["convert_to_ipc"] = run_script(["convert_to_ipc.py"], env)
+
+    print(
+        f"Benchmarking viewer (backend: {args.backend}, {args.iterations} iterations)..."
+    )
+    os.environ.update(env)
+    os.environ["ENRON_BACKEND"] = args.backend
+    os.environ["ENRON_SEARCH_CACHE_SIZE"] = (
+        "0"  # Measure the searches themselves, not cache hits
+    )
+    os.environ["ENRON_SEARCH_CACHE_DIR"] = ""
+    viewer_results = benchmark_viewer(args.iterations, args.seed)
+    for name, summary in viewer_results["operations"].items():
+        print(
+            f"  {name:40} p50 {summary['p50_ms']:9.2f} ms  p95 {summary['p95_ms']:9.2f} ms  p99 {summary['p99_ms']:9.2f} ms"
+        )
+    print(f"  Peak RSS: {viewer_results['peak_rss_mb']:.0f} MB")
+
+    results = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "emails": pl.scan_parquet(parquet_file).select(pl.len()).collect().item(),
+            "backend": args.backend,
+            "search_index": not args.no_index,
+            "body_store": args.body_store,
+            "iterations": args.iterations,
+        },
+        "import": import_results,
+        "viewer": viewer_results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+
+def flatten_metrics(results: Dict[str, Any]) -> Dict[str, float]:
+    """Flatten a results file into {"section/name/metric": value} for the timing and memory metrics"""
+    metrics = {}
+    for name, result in results["import"].items():
+        metrics[f"import/{name}/seconds"] = result["seconds"]
+        metrics[f"import/{name}/peak_rss_mb"] = result["peak_rss_mb"]
+    for name, summary in results["viewer"]["operations"].items():
+        for metric in ["p50_ms", "p95_ms", "p99_ms"]:
+            metrics[f"viewer/{name}/{metric}"] = summary[metric]
+    metrics["viewer/startup_seconds"] = results["viewer"]["startup_seconds"]
+    metrics["viewer/peak_rss_mb"] = results["viewer"]["peak_rss_mb"]
+    return metrics
+
+
+def compare(args: argparse.Namespace) -> None:
+    """Print the change of every metric between two results files, exit with status 1 on a regression."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    for key in ["emails", "backend", "search_index", "body_store", "polars"]:
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(
+                f"Warning: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)})"
+            )
+
+    baseline_metrics = flatten_metrics(baseline)
+    current_metrics = flatten_metrics(current)
+    regressions = []
+    print(f"\n{'metric':55} {'baseline':>12} {'current':>12} {'change':>9}")
+    for key, old in baseline_metrics.items():
+        if key not in current_metrics:
+            continue
+        new = current_metrics[key]
+        change = (new - old) / old * 100 if old > 0 else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:55} {old:12.2f} {new:12.2f} {change:+8.1f}%{flag}")
+
+    print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:g}%")
+    if regressions:
+        raise SystemExit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the email importer and viewer on a synthetic corpus"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser(
+        "generate", help="Generate a synthetic maildir"
+    )
+    generate_parser.add_argument(
+        "--maildir",
+        type=str,
+        default=str(BENCHMARK_DIR / "maildir"),
+        help=f"Directory to create (default: {BENCHMARK_DIR / 'maildir'})",
+    )
+    generate_parser.add_argument(
+        "--emails",
+        type=int,
+        default=20_000,
+        help="Number of email files to generate (default: 20000)",
+    )
+    generate_parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.3,
+        help="Fraction of files that repeat an earlier email in another folder (default: 0.3)",
+    )
+    generate_parser.add_argument(
+        "--seed",
+        type=int,
+        default=DEFAULT_SEED,
+        help=f"Random seed, the same seed always produces the same corpus (default: {DEFAULT_SEED})",
+    )
+
+    run_parser = subparsers.add_parser(
+        "run", help="Benchmark the importer and the viewer"
+    )
+    run_parser.add_argument(
+        "--maildir",
+        type=str,
+        default=str(BENCHMARK_DIR / "maildir"),
+        help=f"Synthetic maildir to import (default: {BENCHMARK_DIR / 'maildir'})",
+    )
+    run_parser.add_argument(
+        "--output",
+        type=str,
+        default=str(BENCHMARK_DIR / "results.json"),
+        help=f"Results file, the corpus files are written next to it (default: {BENCHMARK_DIR / 'results.json'})",
+    )
+    run_parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, 2, min(4, os.cpu_count() or 1)}),
+        help="Importer worker counts to time (default: 1 2 4)",
+    )
+    run_parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["memory", "lazy", "mmap"],
+        default="memory",
+        help="Viewer storage backend (default: memory)",
+    )
+    run_parser.add_argument(
+        "--iterations",
+        type=int,
+        default=20,
+        help="Timed runs of each search (default: 20, lookups run 10x as many)",
+    )
+    run_parser.add_argument(
+        "--no-index",
+        action="store_true",
+        help="Benchmark searches without the inverted search index and the address index",
+    )
+    run_parser.add_argument(
+        "--body-store",
+        action="store_true",
+        help="Benchmark the viewer with the bodies in a separate body store (util/build_body_store.py)",
+    )
+    run_parser.add_argument(
+        "--seed",
+        type=int,
+        default=DEFAULT_SEED,
+        help=f"Random seed for the sampled lookups (default: {DEFAULT_SEED})",
+    )
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument("baseline", type=str, help="Baseline results file")
+    compare_parser.add_argument(
+        "current", type=str, help="Results file to check against the baseline"
+    )
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent slowdown (or memory growth) reported as a regression (default: 10)",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        print("=" * 80)
+        print("Generate Synthetic Maildir")
+        print("=" * 80)
+        maildir_path = Path(args.maildir)
+        if maildir_path.exists():
+            raise SystemExit(f"{maildir_path} already exists, delete it first")
+        print(f"\nWriting {args.emails:,} emails to {maildir_path.as_posix()}...")
+        generate_maildir(maildir_path, args.emails, args.seed, args.duplicate_rate)
+        print("\nDone!")
+    elif args.command == "run":
+        print("=" * 80)
+        print("Benchmark")
+        print("=" * 80)
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Copy the email bodies into a separate body store next to the Parquet corpus.
+When the body store is present, the viewer keeps only the small metadata columns (path, date, subject,
+sender, recipient, ...) in memory. Bodies are read from the store by row id when they are needed: for
+/email, for result snippets, and to re-check the body filters of search candidates. The store is
+written in small compressed row groups, so a lookup only decodes a few hundred kilobytes.
+"""
+
+import os
+
+import polars as pl
+
+from build_search_index import corpus_fingerprint, read_content_version
+
+# Configuration
+PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
+BODY_FILE = os.environ.get("ENRON_BODY_FILE", "enron_bodies.pq")
+# Columns moved to the body store (the lowercase shadow column too, if the corpus has one)
+BODY_COLUMNS = ["body", "body_lc"]
+# Rows per row group (the unit decoded to read a single body) and the compression codec:
+# "lz4" decodes about three times faster than "zstd", for a larger file
+ROW_GROUP_SIZE = int(os.environ.get("ENRON_BODY_ROW_GROUP_SIZE", "250"))
+COMPRESSION = os.environ.get("ENRON_BODY_COMPRESSION", "zstd")
+
+
+def main() -> None:
+    """Main execution function."""
+    print("=" * 80)
+    print("Build Body Store")
+    print("=" * 80)
+
+    schema = pl.read_parquet_schema(PARQUET_FILE)
+    body_columns = [c for c in BODY_COLUMNS if c in schema]
+
+    print(f"\nLoading {', '.join(body_columns)} from {PARQUET_FILE}...")
+    content = read_content_version(PARQUET_FILE)
+    df = pl.read_parquet(PARQUET_FILE, columns=["path"] + body_columns)
+    print(f"Loaded {len(df):,} emails")
+
+    # Rows stay in corpus order: row ids are shared with the corpus file.
+    # Write to a temporary file first, a running viewer may be reading the old store.
+    temp_file = BODY_FILE + ".tmp"
+    print(
+        f"\nWriting body store to {BODY_FILE} ({ROW_GROUP_SIZE:,} rows per row group, {COMPRESSION})..."
+    )
+    df.select(body_columns).write_parquet(
+        temp_file,
+        compression=COMPRESSION,
+        row_group_size=ROW_GROUP_SIZE,
+        metadata={"corpus_fingerprint": corpus_fingerprint(df["path"], content)},
+    )
+    os.replace(temp_file, BODY_FILE)
+
+    metadata_columns = [c for c in schema if c not in body_columns]
+    metadata_size = pl.read_parquet(
+        PARQUET_FILE, columns=metadata_columns
+    ).estimated_size()
+    print(f"  Body store on disk: {os.path.getsize(BODY_FILE) / 1e6:,.1f} MB")
+    print(
+        f"  Bodies in memory: {df.select(body_columns).estimated_size() / 1e6:,.1f} MB"
+    )
+    print(f"  Metadata in memory: {metadata_size / 1e6:,.1f} MB")
+
+    print("\nDone!")
+
+
+if __name__ == "__main__":
+    main()
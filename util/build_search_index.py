@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Build an inverted full-text index for the email corpus.
+Maps every token in subject/sender/recipient/body to the sorted list of row ids containing it,
+so the viewer can narrow a search to a few candidate rows before running the substring scan.
+Also builds the address index, which maps every sender/recipient address to the rows it appears in.
+"""
+
+import os
+import re
+import zlib
+from typing import IO, List, Optional, Tuple, Union
+
+import polars as pl
+
+# Configuration
+PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
+INDEX_FILE = os.environ.get("ENRON_INDEX_FILE", "enron_index.pq")
+INDEXED_COLUMNS = ["subject", "sender", "recipient", "body"]
+TOKEN_PATTERN = r"[a-z0-9]+"
+# Rows tokenized at a time. This only limits the tokenizer's working set: the (token, row id)
+# pairs of every batch are kept until they are grouped, so peak memory still grows with the corpus
+BATCH_SIZE = 50_000
+
+# Characters that make a search string a real regex rather than a plain substring
+REGEX_METACHARACTERS = set(".^$*+?()[]{}|\\")
+
+# Corpus metadata key holding the hash of its contents, written with every corpus file
+CONTENT_VERSION_KEY = "content_version"
+
+# Address index: the distinct lowercase email addresses of these columns
+ADDRESS_INDEX_FILE = os.environ.get("ENRON_ADDRESS_INDEX_FILE", "enron_addresses.pq")
+ADDRESS_COLUMNS = ["sender", "recipient"]
+ADDRESS_PATTERN = r"[\w.'+-]+@[\w.-]+"
+# Searches the address index can answer: address characters, with "." as the regex wildcard
+ADDRESS_QUERY_PATTERN = re.compile(r"[a-z0-9_.'@-]+")
+
+
+def content_version(emails: pl.LazyFrame) -> str:
+    """Hash of every value of the corpus, independent of the row order"""
+    value = emails.select(pl.struct(pl.all()).hash().bitwise_xor()).collect().item()
+    return f"{value or 0:016x}"
+
+
+def read_content_version(source: Union[str, IO[bytes]]) -> str:
+    """Content hash recorded in a corpus Parquet file, "" for files written before it was recorded"""
+    return pl.read_parquet_metadata(source).get(CONTENT_VERSION_KEY, "")
+
+
+def corpus_fingerprint(paths: pl.Series, content: str) -> str:
+    """Fingerprint of the corpus row order and contents, used to detect an index built from a different file"""
+    checksum = zlib.crc32("\n".join(paths.fill_null("").to_list()).encode("utf-8"))
+    return f"{len(paths)}:{checksum:08x}:{content}"
+
+
+def dedupe_key(columns: List[str]) -> List[str]:
+    """Columns identifying duplicate emails: the precomputed dedupe key if present, else subject + body"""
+    return ["dup_group_id"] if "dup_group_id" in columns else ["subject", "body"]
+
+
+def split_query(text: str) -> List[Tuple[str, bool, bool]]:
+    """
+    Split a lowercase search string into index tokens.
+    Returns: [(token, anchored_left, anchored_right)] where an anchored side means the
+    token must start/end exactly there in the document (a separator follows it in the query).
+    """
+    terms = []
+    for match in re.finditer(TOKEN_PATTERN, text):
+        anchored_left = match.start() > 0
+        anchored_right = match.end() < len(text)
+        terms.append((match.group(), anchored_left, anchored_right))
+    return terms
+
+
+def is_plain_query(text: str) -> bool:
+    """Check whether a search string can be answered from the index (ASCII, no regex syntax)"""
+    return text.isascii() and not (set(text) & REGEX_METACHARACTERS)
+
+
+def lookup_postings(
+    index: pl.DataFrame, token: str, anchored_left: bool, anchored_right: bool
+) -> pl.Series:
+    """Return the row ids of every document with a token matching the given term"""
+    tokens = index["token"]
+    if anchored_left:
+        # Exact or prefix match: a contiguous range of the sorted vocabulary
+        start = tokens.search_sorted(token, side="left")
+        if anchored_right:
+            end = tokens.search_sorted(token, side="right")
+        else:
+            end = tokens.search_sorted(
+                token + "{", side="left"
+            )  # "{" sorts after every token character
+        matches = index.slice(start, end - start)
+    elif anchored_right:
+        matches = index.filter(pl.col("token").str.ends_with(token))
+    else:
+        matches = index.filter(pl.col("token").str.contains(token, literal=True))
+
+    if len(matches) == 1:
+        return matches["postings"].explode()
+    return matches["postings"].explode().unique().sort()
+
+
+def search_index(
+    index: pl.DataFrame, text: str, literal: bool = False
+) -> Optional[pl.Series]:
+    """
+    Find candidate rows that may contain text as a case-insensitive substring (a regex, unless literal).
+    Returns None if the index can't narrow the search (regex syntax, non-ASCII, no tokens).
+    """
+    if not (text.isascii() if literal else is_plain_query(text)):
+        return None
+    terms = split_query(text.lower())
+    if not terms:
+        return None
+
+    candidates: Optional[pl.Series] = None
+    for token, anchored_left, anchored_right in terms:
+        postings = lookup_postings(index, token, anchored_left, anchored_right)
+        candidates = (
+            postings
+            if candidates is None
+            else candidates.filter(candidates.is_in(postings.implode()))
+        )
+        if len(candidates) == 0:
+            break
+    return candidates
+
+
+def build_index(df: pl.DataFrame, batch_size: int = BATCH_SIZE) -> pl.DataFrame:
+    """Tokenize the indexed columns and group row ids by token."""
+    print("Tokenizing emails...")
+
+    pairs: List[pl.DataFrame] = []
+    total = len(df)
+    for offset in range(0, total, batch_size):
+        batch = (
+            df.slice(offset, batch_size)
+            .select(INDEXED_COLUMNS)
+            .with_row_index("row_id", offset=offset)
+            .select(
+                pl.col("row_id"),
+                pl.concat_str(INDEXED_COLUMNS, separator="\n", ignore_nulls=True)
+                .str.to_lowercase()
+                .str.extract_all(TOKEN_PATTERN)
+                .list.unique()
+                .alias("token"),
+            )
+            .explode("token")
+            .drop_nulls("token")
+        )
+        pairs.append(batch)
+        print(f"\r{min(offset + batch_size, total)} of {total}", end="", flush=True)
+    print()
+
+    print("Building posting lists...")
+    return (
+        pl.concat(pairs)
+        .group_by("token")
+        .agg(pl.col("row_id").sort().alias("postings"))
+        .sort("token")
+    )
+
+
+def build_address_index(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Build the address dictionary: every distinct address of the address columns, sorted (the position is
+    its address id), with the sorted row ids of the emails that have it in each column. Each list column is
+    stored as one offsets array plus one flat row id array, a CSR layout.
+    The first row has a null address and lists, per column, the rows whose value is not just a ", "-separated
+    list of its addresses (display names, unparseable headers); searches must always re-check those rows.
+    """
+    rows = df.select(
+        pl.int_range(pl.len(), dtype=pl.UInt32).alias("row_id"), *ADDRESS_COLUMNS
+    )
+    index = None
+    irregular = {}
+    for column in ADDRESS_COLUMNS:
+        value = pl.col(column).str.to_lowercase()
+        addresses = rows.select(
+            "row_id",
+            value.str.extract_all(ADDRESS_PATTERN).alias("address"),
+            (value.str.extract_all(ADDRESS_PATTERN).list.join(", ") != value)
+            .fill_null(False)
+            .alias("irregular"),
+        )
+        irregular[column] = [addresses.filter("irregular")["row_id"]]
+        postings = (
+            addresses.select("row_id", pl.col("address").list.unique())
+            .explode("address")
+            .drop_nulls("address")
+            .group_by("address")
+            .agg(pl.col("row_id").sort().alias(column))
+        )
+        index = (
+            postings
+            if index is None
+            else index.join(postings, on="address", how="full", coalesce=True)
+        )
+
+    no_rows = pl.lit([], dtype=pl.List(pl.UInt32))
+    index = index.with_columns(
+        pl.col(column).fill_null(no_rows) for column in ADDRESS_COLUMNS
+    ).sort("address")
+    return pl.concat(
+        [pl.DataFrame({"address": [None], **irregular}, schema=index.schema), index]
+    )
+
+
+def address_postings(
+    index: pl.DataFrame, text: str, columns: List[str], max_rows: int
+) -> Optional[pl.Series]:
+    """
+    Find candidate rows whose value in one of the given address columns may contain text as a case-insensitive
+    substring ("." is looked up as a regex wildcard, which also covers a literal "."). Returns None if the
+    address index can't narrow the search to at most max_rows rows.
+    """
+    pattern = text.lower()
+    # With only address characters and no ".." in the search, a match in a ", "-separated address list lies
+    # within one address, except that a leading or trailing "." may match the separator next to it
+    if not ADDRESS_QUERY_PATTERN.fullmatch(pattern) or ".." in pattern:
+        return None
+    address = pl.col("address")
+    if pattern.startswith("."):
+        address = " " + address
+    if pattern.endswith("."):
+        address = address + ","
+    matches = index.slice(1).filter(address.str.contains(pattern))
+    irregular = index.head(1)
+    frames = [frame[column] for frame in (matches, irregular) for column in columns]
+    if sum(postings.list.len().sum() for postings in frames) > max_rows:
+        return None
+    return (
+        pl.concat([postings.explode() for postings in frames])
+        .drop_nulls()
+        .unique()
+        .sort()
+    )
+
+
+def main() -> None:
+    """Main execution function."""
+    print("=" * 80)
+    print("Build Search Index")
+    print("=" * 80)
+
+    print(f"\nLoading emails from {PARQUET_FILE}...")
+    content = read_content_version(PARQUET_FILE)
+    df = pl.read_parquet(PARQUET_FILE, columns=["path"] + INDEXED_COLUMNS)
+    print(f"Loaded {len(df):,} emails")
+    fingerprint = corpus_fingerprint(df["path"], content)
+
+    index = build_index(df)
+    num_postings = index["postings"].list.len().sum()
+    print(f"  Unique tokens: {len(index):,}")
+    print(f"  Postings: {num_postings:,}")
+
+    print(f"\nWriting index to {INDEX_FILE}...")
+    index.write_parquet(INDEX_FILE, metadata={"corpus_fingerprint": fingerprint})
+
+    print("\nBuilding address index...")
+    address_index = build_address_index(df)
+    print(f"  Unique addresses: {len(address_index) - 1:,}")
+    print(f"Writing address index to {ADDRESS_INDEX_FILE}...")
+    address_index.write_parquet(
+        ADDRESS_INDEX_FILE, metadata={"corpus_fingerprint": fingerprint}
+    )
+
+    print("\nDone!")
+
+
+if __name__ == "__main__":
+    main()
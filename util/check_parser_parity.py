@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Check that the fast email parser produces the same output as the full email parser.
+Parses every file in the maildir with both and reports fast-path coverage and any mismatches.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+from import_emails import (
+    iter_chunks,
+    parse_email_bytes_fast,
+    parse_email_file,
+    scan_maildir,
+)
+
+
+def check_file(file_path: str) -> Tuple[bool, str | None]:
+    """
+    Compare both parsers on one file.
+    Returns: (handled by the fast path, mismatch description or None)
+    """
+    with open(file_path, mode="rb") as file:
+        fast = parse_email_bytes_fast(file.read())
+    if fast is None:
+        return False, None
+
+    try:
+        full = parse_email_file(file_path, fast=False)
+    except Exception as e:  # noqa: BLE001
+        return True, f"full parser failed: {e}"
+
+    # Header objects from the full parser are str subclasses, compare them as plain strings
+    for field, fast_value, full_value in zip(
+        ["subject", "date", "sender", "recipient", "body"], fast, full
+    ):
+        if isinstance(full_value, str):
+            full_value = str(full_value)
+        if fast_value != full_value:
+            return True, f"{field}: fast={fast_value!r} full={full_value!r}"
+    return True, None
+
+
+def check_chunk(file_paths: List[str]) -> Tuple[int, List[Tuple[str, str]]]:
+    """Check a chunk of files. Returns: (number handled by the fast path, [(path, mismatch)])"""
+    fast_count = 0
+    mismatches = []
+    for file_path in file_paths:
+        handled, mismatch = check_file(file_path)
+        fast_count += handled
+        if mismatch is not None:
+            mismatches.append((file_path, mismatch))
+    return fast_count, mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Check the fast email parser against the full parser"
+    )
+    parser.add_argument(
+        "--maildir",
+        type=str,
+        default="maildir",
+        help="Path to maildir directory (default: maildir)",
+    )
+    default_workers = min(4, os.cpu_count() or 1)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default_workers,
+        help=f"Number of worker processes (default: {default_workers})",
+    )
+    args = parser.parse_args()
+
+    maildir_path = Path(args.maildir)
+    print(f"Scanning {maildir_path.as_posix()}...")
+    file_list = scan_maildir(maildir_path)
+    total = len(file_list)
+    print(f"Found {total} files")
+
+    fast_count = 0
+    mismatches: List[Tuple[str, str]] = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for chunk_fast_count, chunk_mismatches in executor.map(
+            check_chunk, iter_chunks(file_list, 500)
+        ):
+            fast_count += chunk_fast_count
+            mismatches.extend(chunk_mismatches)
+
+    for file_path, mismatch in mismatches[:20]:
+        print(f"MISMATCH {file_path}: {mismatch}")
+    print(
+        f"\nFast path handled {fast_count} of {total} files ({fast_count / max(total, 1):.1%})"
+    )
+    print(f"Mismatches: {len(mismatches)}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Convert the Parquet corpus to an uncompressed Arrow IPC (Feather v2) file.
+The viewer can memory-map this file (ENRON_BACKEND=mmap) so every worker process shares one copy
+of the corpus in the OS page cache instead of decoding its own copy of the Parquet file.
+"""
+
+import os
+
+import polars as pl
+import pyarrow as pa
+
+from build_search_index import CONTENT_VERSION_KEY, read_content_version
+
+# Configuration
+PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
+IPC_FILE = os.environ.get("ENRON_IPC_FILE", "enron.arrow")
+
+
+def main() -> None:
+    """Main execution function."""
+    print("=" * 80)
+    print("Convert Corpus to Arrow IPC")
+    print("=" * 80)
+
+    print(f"\nLoading emails from {PARQUET_FILE}...")
+    content = read_content_version(PARQUET_FILE)
+    df = pl.read_parquet(PARQUET_FILE)
+    print(f"Loaded {len(df):,} emails")
+
+    # Must stay uncompressed: compressed buffers can't be memory-mapped zero-copy.
+    # Write to a temporary file first, a running viewer may have the old file mapped.
+    # The content hash of the Parquet corpus is carried over in the schema metadata.
+    temp_file = IPC_FILE + ".tmp"
+    print(f"\nWriting Arrow IPC file: {IPC_FILE}")
+    table = df.to_arrow().replace_schema_metadata({CONTENT_VERSION_KEY: content})
+    with pa.ipc.new_file(temp_file, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(temp_file, IPC_FILE)
+
+    print("\nDone!")
+
+
+if __name__ == "__main__":
+    main()
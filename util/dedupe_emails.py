@@ -10,6 +10,8 @@ from typing import Optional
 
 import polars as pl
 
+from build_search_index import CONTENT_VERSION_KEY, content_version, dedupe_key
+
 # Configuration
 PARQUET_FILE = os.environ.get("ENRON_PARQUET_FILE", "enron.pq")
 OUTPUT_DIR = Path("analysis")
@@ -39,6 +41,7 @@ def deduplicate_emails(
     print("Deduplicating emails...")
     
     original_count = len(df)
+    key = dedupe_key(df.columns)
     
     # Sort by date if requested
     if sort_by_date:
@@ -54,23 +57,23 @@ def deduplicate_emails(
     
     # Count duplicates before deduplicating
     duplicate_counts = (
-        df.group_by(["subject", "body"])
+        df.group_by(key)
         .agg(pl.len().alias("duplicate_count"))
     )
     
     # Deduplicate
-    df_dedup = df_sorted.unique(subset=["subject", "body"], keep=keep_strategy)
+    df_dedup = df_sorted.unique(subset=key, keep=keep_strategy)
     
     # Add duplicate count metadata
     df_dedup = df_dedup.join(
         duplicate_counts,
-        on=["subject", "body"],
+        on=key,
         how="left",
     )
     
     # Add metadata about senders/recipients for duplicates
     sender_recipient_info = (
-        df.group_by(["subject", "body"])
+        df.group_by(key)
         .agg([
             pl.col("sender").n_unique().alias("unique_senders"),
             pl.col("recipient").n_unique().alias("unique_recipients"),
@@ -81,7 +84,7 @@ def deduplicate_emails(
     
     df_dedup = df_dedup.join(
         sender_recipient_info,
-        on=["subject", "body"],
+        on=key,
         how="left",
     )
     
@@ -126,7 +129,10 @@ def main() -> None:
     
     # Save deduplicated corpus
     print(f"\nSaving deduplicated corpus to {DEDUPLICATED_FILE}...")
-    df_dedup.write_parquet(DEDUPLICATED_FILE)
+    df_dedup.write_parquet(
+        DEDUPLICATED_FILE,
+        metadata={CONTENT_VERSION_KEY: content_version(df_dedup.lazy())},
+    )
     
     print("\n" + "=" * 80)
     print("Deduplication Complete!")
@@ -1,16 +1,117 @@
 import argparse
+import itertools
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from datetime import datetime
+import queue
+import re
+import shutil
+import sys
+import tarfile
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import datetime, timedelta, timezone
 from email import policy
 from email.parser import BytesParser
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Sized,
+    Tuple,
+    TypeVar,
+)
 
 import polars as pl
 
+from build_search_index import (
+    ADDRESS_COLUMNS,
+    ADDRESS_INDEX_FILE,
+    CONTENT_VERSION_KEY,
+    build_address_index,
+    content_version,
+    corpus_fingerprint,
+)
+
 DATE_FORMAT_STRING = "%a, %d %b %Y %H:%M:%S %z"
 
+# Fast parser patterns (see parse_email_bytes_fast)
+FAST_CONTROL_PATTERN = re.compile(rb"[\x00-\x08\x0b-\x1f\x7f]")
+FAST_HEADER_PATTERN = re.compile(r"([\x21-\x39\x3b-\x7e]+):")
+FAST_ADDRESS_PATTERN = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)*\Z"
+)
+FAST_DATE_PATTERN = re.compile(
+    r"(?:[A-Za-z]{3}, )?(\d{1,2}) ([A-Za-z]{3}) (\d{4}) (\d{2}):(\d{2})(?::(\d{2}))? ([+-]\d{4})(?: \([A-Za-z]+\))?\Z"
+)
+MONTHS = {
+    month: i
+    for i, month in enumerate(
+        [
+            "jan",
+            "feb",
+            "mar",
+            "apr",
+            "may",
+            "jun",
+            "jul",
+            "aug",
+            "sep",
+            "oct",
+            "nov",
+            "dec",
+        ],
+        1,
+    )
+}
+
+FrameT = TypeVar("FrameT", pl.DataFrame, pl.LazyFrame)
+ItemT = TypeVar("ItemT")
+# An email file to parse: its path, or its path and contents (read from a tarball)
+EmailFile = str | Tuple[str, bytes]
+
+# Columns of the output table
+EMAIL_SCHEMA = {
+    "path": pl.String,
+    "date": pl.Datetime("us", "UTC"),
+    "subject": pl.String,
+    "sender": pl.String,
+    "recipient": pl.String,
+    "body": pl.String,
+}
+# Manifest of the imported files, used by incremental imports to detect changes
+MANIFEST_SCHEMA = {"path": pl.String, "size": pl.Int64, "mtime_ns": pl.Int64}
+DEFAULT_BATCH_SIZE = 10_000
+# Threads listing the mailboxes while the workers parse, and how many directory listings they may queue up
+DISCOVERY_THREADS = 8
+DISCOVERY_QUEUE_SIZE = 64
+# Files parsed per worker task, and how many tasks per worker may be queued at once
+DEFAULT_CHUNK_SIZE = 500
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# Columns that get a precomputed lowercase "<name>_lc" copy for case-insensitive search
+SHADOW_COLUMNS = ["path", "subject", "sender", "recipient", "body"]
+# Integer dedupe key columns computed from subject + body
+DEDUPE_COLUMNS = ["content_hash", "dup_group_id"]
+
+# Parquet layout: emails are written sorted so each row group covers a narrow date range, and
+# the per row group min/max statistics let readers skip row groups outside a date filter
+DEFAULT_ROW_GROUP_SIZE = 10_000
+DEFAULT_COMPRESSION = "zstd"
+COMPRESSION_CODECS = ["zstd", "lz4", "snappy", "gzip", "brotli", "uncompressed"]
+
 
 def scan_maildir(maildir_path: Path) -> List[str]:
     """Recursively scan maildir directory and return list of all file paths."""
@@ -26,15 +127,140 @@ def scan_maildir(maildir_path: Path) -> List[str]:
     return file_list
 
 
+def list_directory(
+    directory: str | Path,
+) -> Tuple[List[Tuple[str, int, int]], List[str]]:
+    """
+    List a directory with os.scandir, like os.walk (symlinked directories aren't followed).
+    Returns: ([(file_path, size, mtime_ns), ...], [subdirectory path, ...])
+    """
+    files: List[Tuple[str, int, int]] = []
+    subdirectories: List[str] = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirectories.append(entry.path)
+            elif entry.name != ".DS_Store":
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    return files, subdirectories
+
+
+def scan_directory(
+    directory: str, found: Callable[[List[Tuple[str, int, int]]], None]
+) -> None:
+    """Recursively list the files under directory, passing each directory's files to found."""
+    try:
+        files, subdirectories = list_directory(directory)
+    except OSError:
+        # Skip unreadable directories, like os.walk
+        return
+    if files:
+        found(files)
+    for subdirectory in subdirectories:
+        scan_directory(subdirectory, found)
+
+
+def discover_maildir(
+    maildir_path: Path,
+    manifest_rows: List[Tuple[str, int, int]],
+    num_threads: int = DISCOVERY_THREADS,
+) -> Iterator[str]:
+    """
+    Yield the file paths of a maildir while it is still being scanned, so parsing starts right away.
+    The mailboxes are listed in parallel threads, which hand over each directory's files through a bounded
+    queue. Appends (file_path, size, mtime_ns) to manifest_rows for each yielded file.
+    """
+    top_level_files, mailboxes = list_directory(maildir_path)
+    listings: queue.Queue[List[Tuple[str, int, int]] | None] = queue.Queue(
+        maxsize=DISCOVERY_QUEUE_SIZE
+    )
+    stopped = threading.Event()
+
+    def put(item: List[Tuple[str, int, int]] | None) -> None:
+        # Give up once the consumer is gone, instead of blocking on a full queue forever
+        while not stopped.is_set():
+            try:
+                listings.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise CancelledError
+
+    def scan_mailbox(mailbox: str) -> None:
+        try:
+            scan_directory(mailbox, put)
+        finally:
+            put(None)
+
+    listings.put(top_level_files)
+    executor = ThreadPoolExecutor(max_workers=num_threads)
+    try:
+        futures = [executor.submit(scan_mailbox, mailbox) for mailbox in mailboxes]
+        pending = len(futures)
+        while pending or not listings.empty():
+            listing = listings.get()
+            if listing is None:
+                pending -= 1
+                continue
+            manifest_rows.extend(listing)
+            for file_path, _, _ in listing:
+                yield file_path
+        for future in futures:
+            future.result()
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def read_tarball(
+    tarball_path: Path, maildir_path: Path, manifest_rows: List[Tuple[str, int, int]]
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Read the email files of a maildir tarball sequentially, without extracting it.
+    Yields (file_path, contents), with the paths the files would have if the archive's top-level
+    directory were extracted to maildir_path, and appends (file_path, size, mtime_ns) to manifest_rows.
+    """
+    # Stream mode: members are read in archive order from a single pass over the compressed file
+    with tarfile.open(tarball_path, mode="r|*") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            parts = member.name.split("/")[1:]
+            if not parts or parts[-1] == ".DS_Store":
+                continue
+            file_path = os.path.join(maildir_path, *parts)
+            file = tar.extractfile(member)
+            assert file is not None
+            manifest_rows.append(
+                (file_path, member.size, int(member.mtime) * 1_000_000_000)
+            )
+            yield file_path, file.read()
+
+
 def parse_email_file(
-    file_path: str, load_body: bool = True
+    file_path: str,
+    load_body: bool = True,
+    fast: bool = False,
+    data: bytes | None = None,
 ) -> Tuple[str, datetime, str, str, str | None]:
     """
     Parse an email file and extract metadata.
+    With fast=True, simple emails skip the full email parser (see parse_email_bytes_fast).
+    data is the file's contents, if they were already read (e.g. from a tarball).
     Returns: (subject, date, sender, recipient, body)
     """
-    with open(file_path, mode="rb") as file:
-        msg = BytesParser(policy=policy.default).parse(file)
+    if data is None:
+        with open(file_path, mode="rb") as file:
+            data = file.read()
+
+    if fast:
+        result = parse_email_bytes_fast(data, load_body=load_body)
+        if result is not None:
+            return result
+
+    msg = BytesParser(policy=policy.default).parsebytes(data)
 
     subject = msg.get("Subject", "[ERR]")
     if not subject:
@@ -58,8 +284,116 @@ def parse_email_file(
     return subject, date, sender, recipient, body
 
 
+@lru_cache(maxsize=65536)
+def parse_date_fast(date_str: str) -> datetime | None:
+    """Parse a "Mon, 14 May 2001 16:39:00 -0700 (PDT)" style date, or None if it has any other form."""
+    match = FAST_DATE_PATTERN.match(date_str)
+    if match is None:
+        return None
+    day, month, year, hour, minute, second, offset = match.groups()
+    month_number = MONTHS.get(month.lower())
+    if month_number is None:
+        return None
+
+    # Same offset arithmetic as email.utils.parsedate_tz
+    sign = -1 if offset[0] == "-" else 1
+    offset_seconds = sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+    try:
+        return datetime(
+            int(year),
+            month_number,
+            int(day),
+            int(hour),
+            int(minute),
+            int(second or 0),
+            tzinfo=timezone(timedelta(seconds=offset_seconds)),
+        )
+    except ValueError:
+        return None
+
+
+def parse_email_bytes_fast(
+    data: bytes, load_body: bool = True
+) -> Tuple[str, datetime, str, str, str | None] | None:
+    """
+    Fast path for the plain RFC-822 layout used by almost every file in the corpus.
+    Splits headers and body at the first blank line and only decodes the headers we keep.
+    Returns None for anything the full parser might treat differently (encoded words, MIME
+    multipart or transfer encodings, non-ASCII headers, display names, unusual dates, ...),
+    so the result is always identical to parse_email_file's full parser.
+    """
+    separator = data.find(b"\n\n")
+    if separator <= 0:
+        return None
+    header_block = data[:separator]
+    if not header_block.isascii() or FAST_CONTROL_PATTERN.search(header_block):
+        return None
+
+    # Unfold headers, keeping the first occurrence of each
+    headers: Dict[str, str] = {}
+    name: str | None = None
+    value_lines: List[str] = []
+    for line in header_block.decode("ascii").split("\n") + [""]:
+        if line[:1] in (" ", "\t") and name is not None:
+            value_lines.append(line)
+            continue
+        if name is not None:
+            headers.setdefault(name.lower(), "".join(value_lines))
+            name = None
+        if not line:
+            break
+        match = FAST_HEADER_PATTERN.match(line)
+        if match is None:
+            return None
+        name = match.group(1)
+        value_lines = [line[match.end() :].lstrip(" \t")]
+
+    if "=?" in headers.get("subject", ""):
+        return None
+    content_type = headers.get("content-type", "text/plain").strip().lower()
+    if not content_type.startswith("text/"):
+        return None
+    if headers.get("content-transfer-encoding", "").strip().lower() not in (
+        "",
+        "7bit",
+        "8bit",
+        "binary",
+    ):
+        return None
+
+    subject = headers.get("subject", "[ERR]")
+    if not subject:
+        subject = "(no subject)"
+
+    addresses = []
+    for header in ("from", "to"):
+        if header not in headers:
+            addresses.append("[ERR]")
+            continue
+        parts = [part.strip() for part in headers[header].split(",")]
+        if not all(FAST_ADDRESS_PATTERN.match(part) for part in parts):
+            return None
+        addresses.append(", ".join(parts))
+    sender, recipient = addresses
+
+    date = parse_date_fast(headers.get("date", ""))
+    if date is None:
+        return None
+
+    body = None
+    if load_body:
+        payload = data[separator + 2 :]
+        if payload:
+            try:
+                body = payload.decode("utf-8")
+            except UnicodeDecodeError:
+                return None
+
+    return subject, date, sender, recipient, body
+
+
 def parse_email_file_wrapper(
-    file_path: str,
+    file_path: str, fast: bool = False, data: bytes | None = None
 ) -> Tuple[str, str, datetime, str, str, str | None] | None:
     """
     Wrapper function for parallel processing that includes file_path in return value.
@@ -67,7 +401,7 @@ def parse_email_file_wrapper(
     """
     try:
         subject, date, sender, recipient, body = parse_email_file(
-            file_path, load_body=True
+            file_path, load_body=True, fast=fast, data=data
         )
         return (file_path, subject, date, sender, recipient, body)
     except Exception as e:  # noqa: BLE001
@@ -75,47 +409,103 @@ def parse_email_file_wrapper(
         return None
 
 
-def parse_emails(
-    file_list: List[str], progress_every: int = 1000, num_workers: int | None = None
+def new_batch() -> Dict[str, List[Any]]:
+    """Create an empty columnar batch of parsed emails."""
+    return {column: [] for column in EMAIL_SCHEMA}
+
+
+def parse_email_chunk(
+    files: List[EmailFile], fast: bool = False
 ) -> Dict[str, List[Any]]:
-    """Process emails continuously and return a dictionary of lists."""
-    paths: List[str] = []
-    dates: List[datetime] = []
-    subjects: List[str] = []
-    senders: List[str] = []
-    recipients: List[str] = []
-    bodies: List[str | None] = []
-
-    total: int = len(file_list)
+    """
+    Parse a chunk of email files in a worker process.
+    Returns a columnar batch, so a whole chunk costs a single pickled round-trip.
+    """
+    batch = new_batch()
+    for file in files:
+        file_path, data = file if isinstance(file, tuple) else (file, None)
+        result = parse_email_file_wrapper(file_path, fast=fast, data=data)
+        if result is not None:
+            file_path, subject, date, sender, recipient, body = result
+            batch["path"].append(file_path)
+            batch["date"].append(date)
+            batch["subject"].append(subject)
+            batch["sender"].append(sender)
+            batch["recipient"].append(recipient)
+            batch["body"].append(body)
+    return batch
+
+
+def iter_chunks(items: Iterable[ItemT], chunk_size: int) -> Iterator[List[ItemT]]:
+    """Split an iterable into lists of up to chunk_size items."""
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        yield chunk
+
+
+def parse_email_batches(
+    file_list: Iterable[EmailFile],
+    batch_size: int,
+    progress_every: int = 1000,
+    num_workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fast_parser: bool = False,
+) -> Iterator[Dict[str, List[Any]]]:
+    """Process emails continuously, yielding columnar batches of about batch_size emails as they complete."""
+    batch = new_batch()
+
+    # A file list read on the fly (from a tarball) has no known total
+    total: int | None = len(file_list) if isinstance(file_list, Sized) else None
     processed: int = 0
 
+    # Backpressure: only keep a few chunks per worker in flight instead of submitting everything upfront
+    max_in_flight = CHUNKS_IN_FLIGHT_PER_WORKER * (num_workers or os.cpu_count() or 1)
+    chunks = iter_chunks(file_list, chunk_size)
+
     executor = ProcessPoolExecutor(max_workers=num_workers)
     interrupted = False
     try:
-        # Submit all tasks upfront for continuous processing
-        future_to_file = {
-            executor.submit(parse_email_file_wrapper, file_path): file_path
-            for file_path in file_list
-        }
-
-        # Process results as they come in continuously
-        for future in as_completed(future_to_file):
-            result = future.result()
-            if result is not None:
-                file_path, subject, date, sender, recipient, body = result
-                paths.append(file_path)
-                dates.append(date)
-                subjects.append(subject)
-                senders.append(sender)
-                recipients.append(recipient)
-                bodies.append(body)
-
-            processed += 1
-            if (processed % progress_every) == 0 or processed == total:
-                pct = round(processed / total * 100)
-                print(f"\r{processed} of {total} ({pct}%)", end="", flush=True)
-    except KeyboardInterrupt:
-        print("\nInterrupted by user. Cancelling remaining tasks...")
+        future_to_size: Dict[Future, int] = {}
+
+        def submit_next_chunk() -> None:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                future_to_size[
+                    executor.submit(parse_email_chunk, chunk, fast_parser)
+                ] = len(chunk)
+
+        for _ in range(max_in_flight):
+            submit_next_chunk()
+
+        # Process results as they come in continuously, topping up the window as chunks finish
+        while future_to_size:
+            done, _ = wait(future_to_size, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_batch = future.result()
+                for column, values in chunk_batch.items():
+                    batch[column].extend(values)
+
+                previous = processed
+                processed += future_to_size.pop(future)
+                submit_next_chunk()
+                if total is None:
+                    if (processed // progress_every) > (
+                        previous // progress_every
+                    ) or not future_to_size:
+                        print(f"\r{processed} parsed", end="", flush=True)
+                elif (processed // progress_every) > (
+                    previous // progress_every
+                ) or processed == total:
+                    pct = round(processed / total * 100)
+                    print(f"\r{processed} of {total} ({pct}%)", end="", flush=True)
+
+                if len(batch["path"]) >= batch_size:
+                    yield batch
+                    batch = new_batch()
+    except (KeyboardInterrupt, GeneratorExit) as e:
+        # GeneratorExit: the consumer stopped early (e.g. it was interrupted while writing a batch)
+        if isinstance(e, KeyboardInterrupt):
+            print("\nInterrupted by user. Cancelling remaining tasks...")
         interrupted = True
         try:
             executor.shutdown(wait=False, cancel_futures=True)
@@ -128,17 +518,159 @@ def parse_emails(
             executor.shutdown(wait=True)
             print()  # Newline after final progress update
 
+    if batch["path"]:
+        yield batch
+
+
+def parse_emails(
+    file_list: Iterable[EmailFile],
+    progress_every: int = 1000,
+    num_workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fast_parser: bool = False,
+) -> Dict[str, List[Any]]:
+    """Process emails continuously and return a dictionary of lists."""
+    emails = new_batch()
+    for batch in parse_email_batches(
+        file_list,
+        batch_size=sys.maxsize,
+        progress_every=progress_every,
+        num_workers=num_workers,
+        chunk_size=chunk_size,
+        fast_parser=fast_parser,
+    ):
+        for column, values in batch.items():
+            emails[column].extend(values)
+
     print("\nBuilding DataFrame...")
+    return emails
+
+
+def write_parts(
+    file_list: Iterable[EmailFile],
+    parts_dir: Path,
+    batch_size: int,
+    num_workers: int | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    fast_parser: bool = False,
+) -> int:
+    """
+    Parse emails and write each batch to its own Parquet part file as soon as it's complete.
+    Numbering continues after any part files already in parts_dir (from an interrupted run).
+    """
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    first_part = len(list(parts_dir.glob("part-*.pq")))
+    num_parts = 0
+    for batch in parse_email_batches(
+        file_list,
+        batch_size=batch_size,
+        num_workers=num_workers,
+        chunk_size=chunk_size,
+        fast_parser=fast_parser,
+    ):
+        # Write to a temporary name first so an interrupted write never leaves a truncated part
+        part_file = parts_dir / f"part-{first_part + num_parts:05d}.pq"
+        pl.DataFrame(batch, schema=EMAIL_SCHEMA).write_parquet(
+            part_file.with_suffix(".tmp")
+        )
+        os.replace(part_file.with_suffix(".tmp"), part_file)
+        num_parts += 1
+    return num_parts
+
+
+def parsed_paths(parts_dir: Path) -> Set[str]:
+    """Return the paths of emails already written to part files (by an interrupted run)."""
+    if not any(parts_dir.glob("part-*.pq")):
+        return set()
+    return set(
+        pl.scan_parquet(parts_dir / "part-*.pq").select("path").collect()["path"]
+    )
+
+
+def stat_files(file_list: List[str]) -> pl.DataFrame:
+    """Build a manifest of file sizes and modification times, used to detect changed files."""
+    sizes: List[int] = []
+    mtimes: List[int] = []
+    for file_path in file_list:
+        stat = os.stat(file_path)
+        sizes.append(stat.st_size)
+        mtimes.append(stat.st_mtime_ns)
+    return pl.DataFrame(
+        {"path": file_list, "size": sizes, "mtime_ns": mtimes}, schema=MANIFEST_SCHEMA
+    )
+
 
-    # Build DataFrame only at the end after all processing is complete
-    return {
-        "path": paths,
-        "date": dates,
-        "subject": subjects,
-        "sender": senders,
-        "recipient": recipients,
-        "body": bodies,
-    }
+def find_unchanged_files(
+    manifest: pl.DataFrame, previous_manifest: pl.DataFrame
+) -> pl.Series:
+    """Return the paths whose size and modification time match the previous import."""
+    return manifest.join(
+        previous_manifest, on=["path", "size", "mtime_ns"], how="semi"
+    )["path"]
+
+
+def add_shadow_columns(df: FrameT) -> FrameT:
+    """Add normalized copies of the searchable columns so searches don't lowercase them per query."""
+    return df.with_columns(
+        [
+            pl.col(column).str.to_lowercase().alias(f"{column}_lc")
+            for column in SHADOW_COLUMNS
+        ]
+    )
+
+
+def add_dedupe_columns(df: FrameT) -> FrameT:
+    """
+    Add a 64-bit hash of subject + body and a dense duplicate group id derived from it,
+    so duplicate detection groups on one integer instead of hashing the full text every time.
+    """
+    return df.with_columns(
+        content_hash=pl.struct("subject", "body").hash()
+    ).with_columns(
+        dup_group_id=(pl.col("content_hash").rank("dense") - 1).cast(pl.UInt32)
+    )
+
+
+def sort_emails(
+    df: pl.LazyFrame, maildir_path: Optional[Path] = None, by_mailbox: bool = False
+) -> pl.LazyFrame:
+    """Sort emails by date (optionally grouped by mailbox first) for row group pruning."""
+    # Stable, so re-sorting an already sorted corpus keeps its row order (and row ids)
+    if not by_mailbox:
+        return df.sort("date", maintain_order=True)
+
+    # Mailbox is the first directory under the maildir, e.g. "lay-k" in "maildir/lay-k/inbox/1."
+    prefix = os.path.join(str(maildir_path), "")
+    mailbox = pl.col("path").str.strip_prefix(prefix).str.split(os.sep).list.first()
+    return df.sort(mailbox, "date", maintain_order=True)
+
+
+def write_corpus(
+    emails: pl.LazyFrame,
+    parquet_file: str,
+    maildir_path: Optional[Path] = None,
+    by_mailbox: bool = False,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+    compression: str = DEFAULT_COMPRESSION,
+) -> str:
+    """
+    Sort the emails and write them as the corpus Parquet file, with per row group statistics
+    and the hash of its contents in the file metadata (which the search index, body store and
+    address index fingerprints include). Returns that hash.
+    """
+    # Hashed before sorting, which the hash doesn't depend on
+    content = content_version(emails)
+    # Write to a temporary file first: the previous corpus may still be being read from
+    temp_file = parquet_file + ".tmp"
+    sort_emails(emails, maildir_path, by_mailbox=by_mailbox).sink_parquet(
+        temp_file,
+        compression=compression,
+        row_group_size=row_group_size,
+        statistics=True,
+        metadata={CONTENT_VERSION_KEY: content},
+    )
+    os.replace(temp_file, parquet_file)
+    return content
 
 
 def main() -> None:
@@ -151,6 +683,12 @@ def main() -> None:
         default="maildir",
         help="Path to maildir directory (default: maildir)",
     )
+    parser.add_argument(
+        "--tarball",
+        type=str,
+        help="Read the emails straight from the corpus tar.gz instead of an extracted maildir "
+        "(paths are recorded as if it had been extracted to --maildir)",
+    )
     parser.add_argument(
         "--parquet",
         type=str,
@@ -164,25 +702,209 @@ def main() -> None:
         default=default_workers,
         help=f"Number of worker processes (default: {default_workers})",
     )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Files parsed per worker task (default: {DEFAULT_CHUNK_SIZE})",
+    )
+    parser.add_argument(
+        "--fast-parser",
+        action="store_true",
+        help="Parse simple emails with a fast header splitter, falling back to the full parser "
+        "for anything else (see util/check_parser_parity.py)",
+    )
+    parser.add_argument(
+        "--no-shadow-columns",
+        action="store_true",
+        help="Don't write the lowercase shadow columns used to speed up search",
+    )
+    parser.add_argument(
+        "--row-group-size",
+        type=int,
+        default=DEFAULT_ROW_GROUP_SIZE,
+        help=f"Rows per Parquet row group (default: {DEFAULT_ROW_GROUP_SIZE})",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=COMPRESSION_CODECS,
+        default=DEFAULT_COMPRESSION,
+        help=f"Parquet compression codec (default: {DEFAULT_COMPRESSION})",
+    )
+    parser.add_argument(
+        "--sort-by-mailbox",
+        action="store_true",
+        help="Sort by mailbox, then date (default: sort by date only)",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write parsed emails to part files in batches instead of collecting them in memory while parsing "
+        "(lowers peak memory, but the final sort still loads the whole corpus)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Emails per part file in streaming mode (default: {DEFAULT_BATCH_SIZE})",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only parse files that are new or changed since the last import, and resume an "
+        "interrupted incremental import from its part files (implies --streaming)",
+    )
+    parser.add_argument(
+        "--address-index",
+        type=str,
+        help=f"Address index output path, for fast sender/recipient/participant searches "
+        f"(default: {ADDRESS_INDEX_FILE} next to the Parquet file)",
+    )
+    parser.add_argument(
+        "--no-address-index",
+        action="store_true",
+        help="Don't build the address index",
+    )
 
     args = parser.parse_args()
+    if args.address_index is None:
+        args.address_index = os.path.join(
+            os.path.dirname(args.parquet), ADDRESS_INDEX_FILE
+        )
+    if args.tarball and args.incremental:
+        parser.error(
+            "--incremental needs an extracted maildir, it can't be combined with --tarball"
+        )
 
     try:
         # Parse emails from maildir
         maildir_path = Path(args.maildir)
-
-        print(f"Scanning {maildir_path.as_posix()}...")
-        file_list: List[str] = scan_maildir(maildir_path)
-        print(f"Found {len(file_list)} files")
-
-        print(f"Parsing emails with {args.workers} workers...")
-        emails: Dict[str, List[Any]] = parse_emails(file_list, num_workers=args.workers)
-
-        print("Converting to DataFrame...")
-        df: pl.DataFrame = pl.DataFrame(emails)
-
-        print(f"Writing to Parquet file: {args.parquet}")
-        df.write_parquet(args.parquet)
+        parts_dir = Path(args.parquet + ".parts")
+        manifest_file = Path(args.parquet + ".manifest.pq")
+
+        # Files are discovered (or read from the tarball) while they are being parsed, and the manifest is
+        # complete once they have all been parsed. Incremental imports need the whole list up front.
+        file_list: Iterable[EmailFile]
+        manifest_rows: List[Tuple[str, int, int]] = []
+        if args.tarball:
+            print(f"Reading {args.tarball}...")
+            file_list = read_tarball(Path(args.tarball), maildir_path, manifest_rows)
+        elif args.incremental:
+            print(f"Scanning {maildir_path.as_posix()}...")
+            file_list = scan_maildir(maildir_path)
+            print(f"Found {len(file_list)} files")
+            manifest = stat_files(file_list)
+        else:
+            print(f"Scanning {maildir_path.as_posix()} while parsing...")
+            file_list = discover_maildir(maildir_path, manifest_rows)
+
+        # Incremental: reuse the rows of files that haven't changed since the last import
+        previous: pl.LazyFrame | None = None
+        to_parse = file_list
+        if args.incremental and os.path.exists(args.parquet) and manifest_file.exists():
+            unchanged = find_unchanged_files(manifest, pl.read_parquet(manifest_file))
+            previous = (
+                pl.scan_parquet(args.parquet)
+                .select(list(EMAIL_SCHEMA))
+                .filter(pl.col("path").is_in(unchanged.implode()))
+            )
+            unchanged_set = set(unchanged)
+            to_parse = [
+                file_path for file_path in file_list if file_path not in unchanged_set
+            ]
+            print(f"{len(unchanged)} unchanged files, {len(to_parse)} new or modified")
+
+            if not to_parse and not any(parts_dir.glob("part-*.pq")):
+                previous_count = (
+                    pl.scan_parquet(args.parquet).select(pl.len()).collect().item()
+                )
+                if previous_count == len(unchanged):
+                    print("Nothing to import, corpus is up to date")
+                    return
+
+        if args.incremental:
+            # Resume: files already in part files from an interrupted run don't need parsing again
+            already_parsed = parsed_paths(parts_dir)
+            if already_parsed:
+                to_parse = [
+                    file_path
+                    for file_path in to_parse
+                    if file_path not in already_parsed
+                ]
+                print(
+                    f"Resuming: {len(already_parsed)} files already parsed in {parts_dir.as_posix()}"
+                )
+        elif args.streaming:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+        if args.streaming or args.incremental:
+            # Parsed batches go to disk as they complete, so parsing only holds one batch in memory. The final
+            # dedupe/sort pass still reads every row of the part files, so peak memory grows with the corpus.
+            print(
+                f"Parsing emails with {args.workers} workers into {parts_dir.as_posix()}..."
+            )
+            num_parts = write_parts(
+                to_parse,
+                parts_dir,
+                batch_size=args.batch_size,
+                num_workers=args.workers,
+                chunk_size=args.chunk_size,
+                fast_parser=args.fast_parser,
+            )
+            print(f"Wrote {num_parts} part files")
+            parsed: pl.LazyFrame | None = None
+            if any(parts_dir.glob("part-*.pq")):
+                parsed = pl.scan_parquet(parts_dir / "part-*.pq")
+                if args.incremental:
+                    # Drop part file rows for files deleted since an interrupted run
+                    parsed = parsed.filter(
+                        pl.col("path").is_in(manifest["path"].implode())
+                    )
+        else:
+            print(f"Parsing emails with {args.workers} workers...")
+            parsed_lists: Dict[str, List[Any]] = parse_emails(
+                to_parse,
+                num_workers=args.workers,
+                chunk_size=args.chunk_size,
+                fast_parser=args.fast_parser,
+            )
+
+            print("Converting to DataFrame...")
+            parsed = pl.DataFrame(parsed_lists, schema=EMAIL_SCHEMA).lazy()
+
+        if not args.incremental:
+            print(f"Found {len(manifest_rows)} files")
+            manifest = pl.DataFrame(manifest_rows, schema=MANIFEST_SCHEMA, orient="row")
+
+        emails: pl.LazyFrame = pl.concat(
+            [frame for frame in [previous, parsed] if frame is not None]
+        )
+        emails = add_dedupe_columns(emails)
+        if not args.no_shadow_columns:
+            emails = add_shadow_columns(emails)
+
+        print(f"Sorting and writing to Parquet file: {args.parquet}")
+        content = write_corpus(
+            emails,
+            args.parquet,
+            maildir_path,
+            by_mailbox=args.sort_by_mailbox,
+            row_group_size=args.row_group_size,
+            compression=args.compression,
+        )
+        manifest.write_parquet(manifest_file)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+        if not args.no_address_index:
+            # Split the sender/recipient headers into a dictionary of addresses with their rows
+            print(f"Building address index: {args.address_index}")
+            corpus = pl.read_parquet(args.parquet, columns=["path"] + ADDRESS_COLUMNS)
+            build_address_index(corpus).write_parquet(
+                args.address_index,
+                metadata={
+                    "corpus_fingerprint": corpus_fingerprint(corpus["path"], content)
+                },
+            )
 
         print("Done!")
     except KeyboardInterrupt: